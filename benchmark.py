@@ -0,0 +1,245 @@
+"""Benchmark pipeline render: foto sintetis + audio sintetis -> mp4.
+
+Menjalankan prepare_frame + render_video (jalur yang sama dengan
+create_video_task, termasuk audio cache dan EncoderTuner) untuk kombinasi
+engine, ukuran foto, profil render dan jumlah job barengan, lalu mencetak
+JSON: wall time, CPU detik, realtime factor, peak RSS ffmpeg, ukuran dan
+bitrate output. Metadata (commit git, versi ffmpeg, jumlah core) ikut
+dicatat supaya hasil antar commit bisa dibandingkan.
+
+Tiap kasus jalan di proses anak sendiri, jadi peak RSS ffmpeg per kasus.
+Database benchmark terpisah dari mvfi.db (MVFI_BENCH_DB, default di folder
+temp); kalibrasi encoder tersimpan di sana dan dipakai ulang antar run.
+
+Contoh:
+    python benchmark.py --duration 240 --profiles standard,still,still_fast
+    python benchmark.py --engines loop --sizes 1600x1200,1080x1920 --workers 1,2,4 --output bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageDraw
+
+# harus sebelum import main: DB_FILE dibaca saat import
+os.environ['MVFI_DB'] = os.environ.get('MVFI_BENCH_DB', os.path.join(tempfile.gettempdir(), 'mvfi_bench.db'))
+
+import main  # noqa: E402
+from main import (AUDIO_BITRATE, RENDER_PROFILES, parse_renditions, prepare_frame, rendition_base_size,
+                  rendition_outputs, render_video)
+
+DEFAULT_SIZES = '1600x1200,1080x1920,1200x1200,4032x3024'
+ENGINES = ('loop', 'encode')
+
+
+def make_test_image(path, width, height):
+    img = Image.new('RGB', (width, height))
+    draw = ImageDraw.Draw(img)
+    for y in range(height):
+        c = int(255 * y / max(1, height - 1))
+        draw.line([(0, y), (width, y)], fill=(c, 80, 255 - c))
+    for i in range(0, width, max(1, width // 12)):
+        draw.ellipse([i, height // 3, i + width // 16, height // 3 + width // 16], fill=(240, 220, 120))
+    img.save(path, quality=92)
+
+
+def make_test_audio(path, duration):
+    """Sine stereo yang langsung di-encode AAC, seperti hasil audio cache."""
+    subprocess.run([
+        'ffmpeg', '-y', '-v', 'error',
+        '-f', 'lavfi', '-i', f'sine=frequency=440:duration={duration}',
+        '-ac', '2', '-c:a', 'aac', '-b:a', AUDIO_BITRATE, path
+    ], check=True)
+
+
+def children_usage():
+    """(cpu_detik, peak_rss_mb) child process yang sudah selesai (ffmpeg).
+
+    Proses ini hanya menjalankan satu kasus (lihat run_case_isolated), jadi
+    ru_maxrss = ffmpeg terbesar di kasus ini."""
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime, usage.ru_maxrss / 1024
+
+
+def run_case(image_path, audio_path, out_dir, duration, profile, workers, engine, renditions):
+    """Satu kasus: `workers` render identik jalan barengan lewat render_video."""
+    main.RENDER_ENGINE = engine
+    # segmen loop dibuat dari nol tiap kasus (cache dingin = job pertama per foto)
+    main.SEGMENT_CACHE_FOLDER = os.path.join(out_dir, 'segments')
+    shutil.rmtree(main.SEGMENT_CACHE_FOLDER, ignore_errors=True)
+
+    start = time.time()
+    frame_path, base_size = prepare_frame(image_path, lambda w, h: rendition_base_size(renditions, w, h))
+    prepare_seconds = time.time() - start
+
+    jobs = []
+    for i in range(workers):
+        output_path = os.path.join(out_dir, f'bench_{engine}_{profile}_{base_size[0]}x{base_size[1]}_{i}.mp4')
+        jobs.append((f'bench_{engine}_{profile}_{i}', rendition_outputs(renditions, output_path, base_size)))
+
+    def render(job):
+        task_id, outputs = job
+        return render_video(task_id, frame_path, audio_path, outputs, base_size, duration, profile)
+
+    cpu_before, _ = children_usage()
+    # seperti RenderQueue: EncoderTuner membagi core ke job yang sedang jalan
+    main.render_queue.active = workers
+    start = time.time()
+    try:
+        with ThreadPoolExecutor(workers) as pool:
+            results = list(pool.map(render, jobs))
+    finally:
+        main.render_queue.active = 0
+    wall = time.time() - start
+    cpu_after, peak_rss = children_usage()
+
+    outputs = [o['path'] for _, job_outputs in jobs for o in job_outputs]
+    if any(code != 0 for code, _, _ in results):
+        return {'engine': engine, 'profile': profile, 'workers': workers, 'error': 'ffmpeg gagal'}
+    output_bytes = os.path.getsize(outputs[0])
+    cpu = cpu_after - cpu_before
+    encoder = results[0][2]
+    for path in outputs + [frame_path]:
+        os.remove(path)  # frame juga, supaya tiap kasus mengukur prepare_frame dari nol
+    return {
+        'engine': encoder['engine'],
+        'profile': profile,
+        'workers': workers,
+        'preset': encoder['preset'],
+        'threads': encoder['threads'],
+        'output_size': f'{base_size[0]}x{base_size[1]}',
+        'renditions': len(jobs[0][1]),
+        'prepare_seconds': round(prepare_seconds, 3),
+        'wall_seconds': round(wall, 2),
+        'cpu_seconds': round(cpu, 2),
+        'cpu_seconds_per_video': round(cpu / workers, 2),
+        'realtime_factor': round(duration * workers / wall, 1) if wall else None,
+        'videos_per_minute': round(workers * 60 / wall, 2) if wall else None,
+        'peak_rss_mb': round(peak_rss, 1),
+        'output_bytes': output_bytes,
+        'output_kbps': round(output_bytes * 8 / duration / 1000, 1),
+    }
+
+
+def setup(tmp):
+    """Cache + index benchmark di tmp, terpisah dari cache aplikasi."""
+    main.FRAME_CACHE_FOLDER = os.path.join(tmp, 'frames')
+    main.audio_cache.folder = os.path.join(tmp, 'audio')
+    # index musik sendiri tanpa thread scan folder musik aplikasi
+    main.music_index = main.MusicIndex(os.path.join(tmp, 'music_index.json'))
+    main.music_index._started = True
+    main.encoder_tuner.start()
+    main.encoder_tuner.ready.wait(main.AUTOTUNE_CALIBRATION_TIMEOUT)
+
+
+def run_case_isolated(case):
+    """run_case di proses anak (`--case`), supaya CPU dan peak RSS terukur per kasus."""
+    result = subprocess.run([sys.executable, os.path.abspath(__file__), '--case', json.dumps(case)],
+                            stdout=subprocess.PIPE, text=True)
+    if result.returncode != 0:
+        return {'engine': case['engine'], 'profile': case['profile'], 'workers': case['workers'],
+                'error': f'proses kasus gagal (exit {result.returncode})'}
+    return json.loads(result.stdout)
+
+
+def case_cli(case):
+    setup(case['tmp'])
+    result = run_case(case['image_path'], case['audio_path'], case['tmp'], case['duration'], case['profile'],
+                      case['workers'], case['engine'], parse_renditions(case['renditions']))
+    print(json.dumps(result))
+
+
+def environment():
+    def run(cmd):
+        try:
+            return subprocess.run(cmd, capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+    ffmpeg = run(['ffmpeg', '-version'])
+    return {
+        'commit': run(['git', '-C', main.BASE_DIR, 'rev-parse', '--short', 'HEAD']),
+        'dirty': bool(run(['git', '-C', main.BASE_DIR, 'status', '--porcelain', '--untracked-files=no'])),
+        'ffmpeg': ffmpeg.splitlines()[0] if ffmpeg else None,
+        'cpu_count': os.cpu_count(),
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--duration', type=float, default=240, help='durasi audio (detik)')
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help='ukuran foto sumber WxH, pisah koma')
+    parser.add_argument('--profiles', default=','.join(RENDER_PROFILES), help='daftar profil, pisah koma')
+    parser.add_argument('--workers', default='1', help='jumlah render barengan, pisah koma (mis. 1,2,4)')
+    parser.add_argument('--engines', default=','.join(ENGINES), help='engine render (loop, encode), pisah koma')
+    parser.add_argument('--renditions', help='daftar rendition seperti di /create (default: DEFAULT_RENDITIONS)')
+    parser.add_argument('--output', help='tulis JSON ke file ini (default: stdout)')
+    parser.add_argument('--case', help=argparse.SUPPRESS)  # internal: satu kasus di proses anak
+    args = parser.parse_args()
+    if args.case:
+        case_cli(json.loads(args.case))
+        return
+
+    sizes = [tuple(int(v) for v in s.lower().split('x')) for s in args.sizes.split(',') if s]
+    profiles = [p for p in args.profiles.split(',') if p]
+    workers = [int(w) for w in args.workers.split(',') if w]
+    engines = [e for e in args.engines.split(',') if e]
+    for p in profiles:
+        if p not in RENDER_PROFILES:
+            parser.error(f'profil tidak dikenal: {p}')
+    for e in engines:
+        if e not in ENGINES:
+            parser.error(f'engine tidak dikenal: {e}')
+    try:
+        renditions = parse_renditions(args.renditions)
+    except ValueError as e:
+        parser.error(str(e))
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        setup(tmp)  # kalibrasi sekali di sini, proses kasus tinggal baca dari database benchmark
+        audio_path = os.path.join(tmp, 'bench.m4a')
+        make_test_audio(audio_path, args.duration)
+        main.audio_cache.get(audio_path)  # audio cache hangat, seperti track yang sudah pernah dipakai
+        for width, height in sizes:
+            image_path = os.path.join(tmp, f'bench_{width}x{height}.jpg')
+            make_test_image(image_path, width, height)
+            for n in workers:
+                for engine in engines:
+                    case = []
+                    for p in profiles:
+                        r = run_case_isolated({
+                            'tmp': tmp, 'image_path': image_path, 'audio_path': audio_path,
+                            'duration': args.duration, 'profile': p, 'workers': n, 'engine': engine,
+                            'renditions': args.renditions,
+                        })
+                        r['source_size'] = f'{width}x{height}'
+                        case.append(r)
+                    base = next((r for r in case if r['profile'] == 'standard' and 'error' not in r), None)
+                    if base:
+                        for r in case:
+                            if 'error' not in r:
+                                r['speedup_vs_standard'] = round(base['wall_seconds'] / r['wall_seconds'], 1)
+                    results.extend(case)
+
+    report = json.dumps({'env': dict(environment(), db=main.DB_FILE), 'duration': args.duration,
+                         'renditions': [r['name'] for r in renditions], 'results': results}, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report + '\n')
+    else:
+        print(report)
+
+
+if __name__ == '__main__':
+    main_cli()
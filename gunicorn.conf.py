@@ -0,0 +1,27 @@
+"""Konfigurasi gunicorn: gunicorn -c gunicorn.conf.py wsgi:app"""
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+
+# Tiap stream SSE (/progress/stream) menahan satu thread selama job berjalan,
+# jadi pakai worker gthread dengan banyak thread, bukan sync worker.
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+worker_class = 'gthread'
+threads = int(os.environ.get('WEB_THREADS', 32))
+
+# Upload foto/video dan SSE bisa lama; timeout di gthread hanya untuk worker macet.
+timeout = 120
+graceful_timeout = 30
+keepalive = 5
+
+# Tiap worker HTTP juga menjalankan RENDER_WORKERS thread render kecuali
+# MVFI_BACKGROUND_IN_WEB=0. Jumlah render barengan dan pembagian -threads
+# dihitung dari job 'running' di database, jadi batasnya tetap satu untuk
+# semua worker (dan `python main.py worker` kalau dijalankan juga).
+
+# Jangan preload: thread background (render, kirim web 1, music index) harus
+# dibuat di dalam proses worker, bukan di master sebelum fork.
+preload_app = False
+
+accesslog = '-'
+errorlog = '-'
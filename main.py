@@ -3,13 +3,31 @@ import glob
 import subprocess
 import json
 import threading
+import queue
+import itertools
 import uuid
 import time
 import random
 import urllib.request
 import urllib.parse
-from flask import Flask, render_template, request, jsonify, send_file, send_from_directory
-from PIL import Image
+import urllib.error
+import http.client
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import hashlib
+import tempfile
+import io
+import collections
+import sqlite3
+import socket
+import sys
+import math
+import platform
+import contextlib
+import mimetypes
+import re
+from flask import Flask, Response, abort, render_template, request, jsonify, send_file
+from werkzeug.security import safe_join
+from PIL import Image, ImageOps, features
 
 app = Flask(__name__)
 app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024  # 100MB
@@ -26,6 +44,695 @@ WEB1_URL = os.environ.get('WEB1_URL', 'https://small-jeana-botalesya-7f9a1b98.ko
 WEB1_API_KEY = os.environ.get('WEB1_API_KEY', '')  # kosong = tidak pakai API key
 SENT_LOG_FILE = os.path.join(BASE_DIR, 'sent_log.json')  # track video yg sudah di-send
 
+# ─── DATABASE ─────────────────────────────────────────────
+# Log video / maker / sent / pin history disimpan di SQLite (mode WAL) supaya
+# aman ditulis dari banyak thread dan tidak perlu baca-tulis ulang satu file
+# JSON penuh tiap operasi. File JSON lama dimigrasi sekali saat pertama jalan.
+DB_FILE = os.environ.get('MVFI_DB', os.path.join(BASE_DIR, 'mvfi.db'))
+MAKER_LOG_FILE = os.path.join(BASE_DIR, 'maker_log.json')
+HASIL_LOG_FILE = os.path.join(HASIL_VIDEO_FOLDER, 'log.json')
+
+DB_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS videos (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT,
+    filename TEXT NOT NULL UNIQUE,
+    thumb_url TEXT NOT NULL DEFAULT '',
+    source TEXT NOT NULL DEFAULT '',
+    music TEXT NOT NULL DEFAULT '',
+    created_at TEXT NOT NULL DEFAULT '',
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_videos_thumb_url ON videos(thumb_url);
+CREATE INDEX IF NOT EXISTS idx_videos_created_at ON videos(created_at);
+CREATE TABLE IF NOT EXISTS maker_log (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT,
+    filename TEXT NOT NULL,
+    created_at TEXT NOT NULL DEFAULT '',
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_maker_log_filename ON maker_log(filename);
+CREATE INDEX IF NOT EXISTS idx_maker_log_created_at ON maker_log(created_at);
+CREATE TABLE IF NOT EXISTS sent_log (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    filename TEXT NOT NULL,
+    thumb_url TEXT NOT NULL DEFAULT '',
+    sent_at TEXT NOT NULL DEFAULT '',
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sent_log_filename ON sent_log(filename);
+CREATE INDEX IF NOT EXISTS idx_sent_log_thumb_url ON sent_log(thumb_url);
+CREATE INDEX IF NOT EXISTS idx_sent_log_sent_at ON sent_log(sent_at);
+CREATE TABLE IF NOT EXISTS pin_history (
+    query TEXT PRIMARY KEY,
+    seen_ids TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS render_cache (
+    key TEXT PRIMARY KEY,
+    task_id TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    created_at TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS idx_render_cache_filename ON render_cache(filename);
+CREATE TABLE IF NOT EXISTS progress (
+    task_id TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    updated_at REAL NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_progress_version ON progress(version);
+CREATE INDEX IF NOT EXISTS idx_progress_updated_at ON progress(updated_at);
+CREATE TABLE IF NOT EXISTS render_jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    args TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 5,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    heartbeat_at REAL,
+    worker TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_render_jobs_queue ON render_jobs(status, priority, created_at);
+CREATE TABLE IF NOT EXISTS metrics_snapshots (
+    worker TEXT PRIMARY KEY,
+    updated_at REAL NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS loudness (
+    sha256 TEXT PRIMARY KEY,
+    measured_at TEXT NOT NULL DEFAULT '',
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS used_images (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    video_id TEXT NOT NULL,
+    dhash INTEGER NOT NULL,
+    image_sha TEXT NOT NULL DEFAULT '',
+    thumb_url TEXT NOT NULL DEFAULT '',
+    created_at TEXT NOT NULL DEFAULT ''
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_used_images_video ON used_images(video_id, image_sha);
+CREATE TABLE IF NOT EXISTS image_dhash (
+    key TEXT PRIMARY KEY,
+    dhash INTEGER NOT NULL
+);
+"""
+
+_db_local = threading.local()
+_db_init_lock = threading.Lock()
+_db_ready = False
+
+
+def _connect():
+    conn = sqlite3.connect(DB_FILE, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA busy_timeout=30000')
+    return conn
+
+
+def get_db():
+    """Koneksi SQLite per thread; schema + migrasi JSON dijalankan sekali."""
+    global _db_ready
+    if not _db_ready:
+        with _db_init_lock:
+            if not _db_ready:
+                conn = _connect()
+                conn.executescript(DB_SCHEMA)
+                upgrade_schema(conn)
+                migrate_json_logs(conn)
+                migrate_render_jobs(conn)
+                conn.close()
+                _db_ready = True
+    conn = getattr(_db_local, 'conn', None)
+    if conn is None:
+        conn = _connect()
+        _db_local.conn = conn
+    return conn
+
+
+# Kolom yang ditambahkan setelah tabel dibuat: (tabel, kolom, deklarasi)
+DB_ADDED_COLUMNS = [
+    ('sent_log', 'delivery_id', 'TEXT'),
+    ('sent_log', 'status', "TEXT NOT NULL DEFAULT 'sent'"),
+]
+DB_ADDED_INDEXES = [
+    'CREATE INDEX IF NOT EXISTS idx_videos_id ON videos(id)',
+    'CREATE UNIQUE INDEX IF NOT EXISTS idx_sent_log_delivery_id ON sent_log(delivery_id)',
+    'CREATE INDEX IF NOT EXISTS idx_sent_log_status ON sent_log(status)',
+]
+
+
+def upgrade_schema(conn):
+    """Tambah kolom/index baru ke database lama (ALTER TABLE kalau belum ada)."""
+    with conn:
+        for table, column, decl in DB_ADDED_COLUMNS:
+            cols = {r['name'] for r in conn.execute(f'PRAGMA table_info({table})')}
+            if column not in cols:
+                conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {decl}')
+        for sql in DB_ADDED_INDEXES:
+            conn.execute(sql)
+
+
+def _read_json(path, default):
+    if not os.path.exists(path):
+        return default
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except:
+        return default
+
+
+def migrate_json_logs(conn):
+    """Pindahkan isi log JSON lama ke SQLite (sekali saja, file lama dibiarkan)."""
+    if conn.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone():
+        return
+    with conn:
+        # file JSON lama urut terbaru dulu -> dibalik supaya seq naik sesuai waktu
+        for e in reversed(_read_json(HASIL_LOG_FILE, [])):
+            _insert_video(conn, e)
+        for e in reversed(_read_json(MAKER_LOG_FILE, [])):
+            _insert_maker(conn, e)
+        for e in reversed(_read_json(SENT_LOG_FILE, [])):
+            _insert_sent(conn, e)
+        for q, ids in _read_json(PIN_HISTORY_FILE, {}).items():
+            conn.execute('INSERT OR REPLACE INTO pin_history (query, seen_ids) VALUES (?, ?)',
+                         (q, json.dumps(ids)))
+        conn.execute("INSERT INTO meta (key, value) VALUES ('json_migrated', ?)",
+                     (time.strftime('%Y-%m-%d %H:%M:%S'),))
+
+
+def migrate_render_jobs(conn):
+    """Pindahkan render_jobs.json (antrian versi lama) ke tabel render_jobs, sekali saja."""
+    if conn.execute("SELECT 1 FROM meta WHERE key = 'render_jobs_migrated'").fetchone():
+        return
+    with conn:
+        for j in _read_json(RENDER_JOBS_FILE, []):
+            status = 'queued' if j.get('status') == 'running' else j.get('status', 'queued')
+            conn.execute(
+                'INSERT OR IGNORE INTO render_jobs (id, kind, args, priority, status, attempts, '
+                'created_at, started_at, finished_at, error) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (j['id'], j['kind'], json.dumps(j.get('args', [])), j.get('priority', 5), status,
+                 j.get('attempts', 0), j.get('created_at') or time.time(), j.get('started_at'),
+                 j.get('finished_at'), j.get('error'))
+            )
+        conn.execute("INSERT INTO meta (key, value) VALUES ('render_jobs_migrated', ?)",
+                     (time.strftime('%Y-%m-%d %H:%M:%S'),))
+
+
+def _insert_video(conn, entry):
+    conn.execute(
+        'INSERT OR REPLACE INTO videos (id, filename, thumb_url, source, music, created_at, data) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?)',
+        (entry.get('id'), entry.get('filename', ''), entry.get('thumb_url') or '',
+         entry.get('source', 'pin'), entry.get('music', ''), entry.get('created_at', ''),
+         json.dumps(entry))
+    )
+
+
+def _insert_maker(conn, entry):
+    conn.execute(
+        'INSERT INTO maker_log (id, filename, created_at, data) VALUES (?, ?, ?, ?)',
+        (entry.get('id'), entry.get('filename', ''), entry.get('created_at', ''), json.dumps(entry))
+    )
+
+
+def _insert_sent(conn, entry):
+    conn.execute(
+        'INSERT INTO sent_log (filename, thumb_url, sent_at, delivery_id, status, data) '
+        'VALUES (?, ?, ?, ?, ?, ?)',
+        (entry.get('filename', ''), entry.get('thumb_url') or '', entry.get('sent_at', ''),
+         entry.get('delivery_id'), entry.get('status', 'sent'), json.dumps(entry))
+    )
+
+
+# status kiriman terakhir per file (dipakai join log video/maker dengan sent_log)
+SENT_STATUS_SQL = ('(SELECT s.status FROM sent_log s WHERE s.filename = t.filename '
+                   'ORDER BY s.seq DESC LIMIT 1)')
+
+
+def query_log(table, filters=(), limit=None, cursor=None, since=None, offset=0, with_sent=False):
+    """Halaman log terbaru dulu. Return (items, total_sesuai_filter).
+
+    filters: list (sql, params) yang di-AND; cursor = ambil seq < cursor
+    (halaman berikutnya), since = hanya seq > since (entri baru saja).
+    """
+    conds, params = [], []
+    for sql, ps in filters:
+        conds.append(sql)
+        params.extend(ps)
+    where = ' AND '.join(conds) or '1'
+    conn = get_db()
+    total = conn.execute(f'SELECT COUNT(*) FROM {table} t WHERE {where}', params).fetchone()[0]
+    page_conds, page_params = [where], list(params)
+    if cursor is not None:
+        page_conds.append('t.seq < ?')
+        page_params.append(cursor)
+    if since is not None:
+        page_conds.append('t.seq > ?')
+        page_params.append(since)
+    cols = f't.seq, t.data{", " + SENT_STATUS_SQL + " AS sent_status" if with_sent else ""}'
+    sql = f'SELECT {cols} FROM {table} t WHERE {" AND ".join(page_conds)} ORDER BY t.seq DESC'
+    if limit is not None:
+        sql += ' LIMIT ? OFFSET ?'
+        page_params += [limit, offset]
+    items = []
+    for r in conn.execute(sql, page_params):
+        item = json.loads(r['data'])
+        item['seq'] = r['seq']
+        if with_sent:
+            item['sent_status'] = r['sent_status']
+        items.append(item)
+    return items, total
+
+
+def log_version():
+    row = get_db().execute("SELECT value FROM meta WHERE key = 'log_version'").fetchone()
+    return int(row['value']) if row else 0
+
+
+def _touch_logs(conn):
+    """Naikkan log_version (dipakai ETag endpoint log) di transaksi yang sama."""
+    conn.execute("INSERT INTO meta (key, value) VALUES ('log_version', '1') "
+                 "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1")
+
+
+def add_video_log(entry):
+    conn = get_db()
+    with conn:
+        _insert_video(conn, entry)
+        _touch_logs(conn)
+
+
+def get_video_entry(filename):
+    row = get_db().execute('SELECT data FROM videos WHERE filename = ?', (filename,)).fetchone()
+    return json.loads(row['data']) if row else None
+
+
+def get_video_by_id(video_id):
+    row = get_db().execute('SELECT data FROM videos WHERE id = ? LIMIT 1', (video_id,)).fetchone()
+    return json.loads(row['data']) if row else None
+
+
+def delete_video_log(filename):
+    conn = get_db()
+    with conn:
+        conn.execute('DELETE FROM videos WHERE filename = ?', (filename,))
+        _touch_logs(conn)
+
+
+def find_used_thumb_urls(urls):
+    """Subset dari urls yang sudah pernah dijadikan video (lookup lewat index)."""
+    urls = [u for u in set(urls) if u]
+    if not urls:
+        return set()
+    marks = ','.join('?' * len(urls))
+    rows = get_db().execute(f'SELECT DISTINCT thumb_url FROM videos WHERE thumb_url IN ({marks})', urls)
+    return {r['thumb_url'] for r in rows}
+
+
+def add_maker_log(entry):
+    conn = get_db()
+    with conn:
+        _insert_maker(conn, entry)
+        _touch_logs(conn)
+
+
+def delete_maker_log_entry(filename):
+    conn = get_db()
+    with conn:
+        conn.execute('DELETE FROM maker_log WHERE filename = ?', (filename,))
+        _touch_logs(conn)
+
+
+def add_sent_log_once(entry):
+    """Insert kiriman baru kecuali file yang sama sudah terkirim / masih antri.
+
+    Cek + insert dalam satu transaksi BEGIN IMMEDIATE, jadi aman juga antar
+    proses (worker gunicorn). Return False kalau sudah ada."""
+    conn = get_db()
+    with conn:
+        conn.execute('BEGIN IMMEDIATE')
+        if conn.execute("SELECT 1 FROM sent_log WHERE filename = ? AND status != 'failed' LIMIT 1",
+                        (entry.get('filename', ''),)).fetchone():
+            return False
+        _insert_sent(conn, entry)
+        _touch_logs(conn)
+    return True
+
+
+def get_delivery(delivery_id):
+    row = get_db().execute('SELECT data FROM sent_log WHERE delivery_id = ?', (delivery_id,)).fetchone()
+    return json.loads(row['data']) if row else None
+
+
+def update_delivery(delivery_id, **fields):
+    conn = get_db()
+    with conn:
+        row = conn.execute('SELECT data FROM sent_log WHERE delivery_id = ?', (delivery_id,)).fetchone()
+        if not row:
+            return
+        entry = json.loads(row['data'])
+        entry.update(fields)
+        conn.execute(
+            'UPDATE sent_log SET status = ?, sent_at = ?, data = ? WHERE delivery_id = ?',
+            (entry.get('status', 'sent'), entry.get('sent_at', ''), json.dumps(entry), delivery_id)
+        )
+        _touch_logs(conn)
+
+
+def claim_delivery(wid):
+    """Ambil delivery 'queued' paling lama dan tandai 'sending' milik worker wid."""
+    conn = get_db()
+    with conn:
+        conn.execute('BEGIN IMMEDIATE')
+        row = conn.execute(
+            "SELECT delivery_id, data FROM sent_log WHERE status = 'queued' ORDER BY seq LIMIT 1"
+        ).fetchone()
+        if not row:
+            return None
+        entry = json.loads(row['data'])
+        entry.update(status='sending', worker=wid, claimed_at=time.time())
+        conn.execute("UPDATE sent_log SET status = 'sending', data = ? WHERE delivery_id = ?",
+                     (json.dumps(entry), row['delivery_id']))
+        _touch_logs(conn)
+    return row['delivery_id']
+
+
+def requeue_stale_deliveries(lease):
+    """Delivery 'sending' yang workernya mati / lewat lease dikembalikan ke 'queued'."""
+    conn = get_db()
+    stale_before = time.time() - lease
+    for row in conn.execute("SELECT delivery_id, data FROM sent_log WHERE status = 'sending'").fetchall():
+        entry = json.loads(row['data'])
+        if worker_alive(entry.get('worker')) and entry.get('claimed_at', 0) >= stale_before:
+            continue
+        entry.update(status='queued', worker=None)
+        with conn:
+            conn.execute("UPDATE sent_log SET status = 'queued', data = ? WHERE delivery_id = ? AND status = 'sending'",
+                         (json.dumps(entry), row['delivery_id']))
+            _touch_logs(conn)
+
+
+def get_pin_seen(query):
+    row = get_db().execute('SELECT seen_ids FROM pin_history WHERE query = ?', (query,)).fetchone()
+    return json.loads(row['seen_ids']) if row else []
+
+
+def set_pin_seen(query, ids):
+    conn = get_db()
+    with conn:
+        conn.execute('INSERT OR REPLACE INTO pin_history (query, seen_ids) VALUES (?, ?)',
+                     (query, json.dumps(ids)))
+
+
+def get_render_cache(key):
+    row = get_db().execute('SELECT task_id, filename FROM render_cache WHERE key = ?', (key,)).fetchone()
+    return dict(row) if row else None
+
+
+def delete_render_cache(filename):
+    conn = get_db()
+    with conn:
+        conn.execute('DELETE FROM render_cache WHERE filename = ?', (filename,))
+
+
+def get_loudness(key):
+    """key = sha256 isi track + target loudnorm (lihat track_loudness)."""
+    row = get_db().execute('SELECT data FROM loudness WHERE sha256 = ?', (key,)).fetchone()
+    return json.loads(row['data']) if row else None
+
+
+def set_loudness(key, data):
+    conn = get_db()
+    with conn:
+        conn.execute('INSERT OR REPLACE INTO loudness (sha256, measured_at, data) VALUES (?, ?, ?)',
+                     (key, time.strftime('%Y-%m-%d %H:%M:%S'), json.dumps(data)))
+
+
+LOG_PAGE_MAX = 500
+
+
+def _date_filters(column):
+    """?date_from=YYYY-MM-DD&date_to=YYYY-MM-DD (inklusif) untuk kolom teks tanggal."""
+    filters = []
+    if request.args.get('date_from'):
+        filters.append((f't.{column} >= ?', [request.args['date_from']]))
+    if request.args.get('date_to'):
+        filters.append((f't.{column} < ?', [request.args['date_to'] + '~']))  # '~' > semua jam
+    return filters
+
+
+def _sent_filter():
+    """?sent=1 -> sudah dikirim / antri kirim, ?sent=0 -> belum (gagal dihitung belum)."""
+    sent = request.args.get('sent')
+    if sent == '1':
+        return [(f"COALESCE({SENT_STATUS_SQL}, 'failed') != 'failed'", [])]
+    if sent == '0':
+        return [(f"COALESCE({SENT_STATUS_SQL}, 'failed') = 'failed'", [])]
+    return []
+
+
+def log_listing(table, filters=(), with_sent=False):
+    """Response list log: ?limit=&cursor= (halaman), ?since= (entri baru), ?offset= (lama).
+
+    Header: X-Total-Count, X-Next-Cursor (kalau masih ada halaman), X-Latest-Seq.
+    ETag berubah hanya kalau ada tulis ke log, jadi refresh yang sama dapat 304.
+    """
+    etag = f'{table}-{log_version()}-{hashlib.sha1(request.query_string).hexdigest()[:16]}'
+    if request.if_none_match.contains_weak(etag):
+        resp = Response(status=304)
+    else:
+        limit = request.args.get('limit', type=int)
+        if limit is not None:
+            limit = max(1, min(limit, LOG_PAGE_MAX))
+        # ambil satu baris lebih untuk tahu apakah masih ada halaman berikutnya
+        items, total = query_log(
+            table, filters, limit=limit + 1 if limit is not None else None,
+            cursor=request.args.get('cursor', type=int),
+            since=request.args.get('since', type=int),
+            offset=max(0, request.args.get('offset', default=0, type=int)),
+            with_sent=with_sent,
+        )
+        has_more = limit is not None and len(items) > limit
+        items = items[:limit] if has_more else items
+        resp = jsonify(items)
+        resp.headers['X-Total-Count'] = str(total)
+        if has_more:
+            resp.headers['X-Next-Cursor'] = str(items[-1]['seq'])
+        latest = get_db().execute(f'SELECT COALESCE(MAX(seq), 0) FROM {table}').fetchone()[0]
+        resp.headers['X-Latest-Seq'] = str(latest)
+    resp.set_etag(etag, weak=True)
+    resp.headers['Cache-Control'] = 'no-cache'
+    return resp
+
+
+_worker_token = (None, None)  # (pid, token) — dibuat ulang kalau proses di-fork
+
+
+def worker_id():
+    """Identitas proses ini di job/delivery yang sedang dikerjakan: host:pid:token.
+
+    Token acak per start proses, jadi container yang restart dengan hostname + pid
+    sama (pid 1) tidak dianggap pemilik job proses lama."""
+    global _worker_token
+    pid = os.getpid()
+    if _worker_token[0] != pid:
+        _worker_token = (pid, uuid.uuid4().hex[:12])
+    return f'{socket.gethostname()}:{pid}:{_worker_token[1]}'
+
+
+def worker_alive(wid):
+    """False kalau wid adalah proses di host ini yang sudah mati (host lain dianggap hidup)."""
+    parts = (wid or '').split(':')
+    if len(parts) == 2:
+        parts.append('')  # format lama host:pid, tanpa token
+    if len(parts) != 3 or parts[0] != socket.gethostname() or not parts[1].isdigit():
+        return True
+    if wid == worker_id():
+        return True
+    if int(parts[1]) == os.getpid():
+        return False  # pid sama tapi token beda: proses sebelum restart
+    try:
+        os.kill(int(parts[1]), 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+
+# ─── METRICS & LOG ────────────────────────────────────────
+# Counter/histogram sederhana per proses, di-flush berkala ke tabel
+# metrics_snapshots (satu baris per proses) lalu dijumlahkan di /metrics
+# (format teks Prometheus), jadi worker gunicorn + `main.py worker` terlihat
+# sebagai satu layanan. Tiap stage juga ditulis sebagai log JSON satu baris.
+LOG_JSON = os.environ.get('LOG_JSON', '1') == '1'
+METRICS_FLUSH_INTERVAL = 10
+METRICS_STALE_SECONDS = 3600  # snapshot proses yang sudah mati dibuang setelah ini
+METRIC_BUCKETS = {
+    'mvfi_stage_seconds': (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600),
+    'mvfi_encode_speed_ratio': (0.5, 1, 2, 5, 10, 20, 50, 100, 200),
+}
+METRIC_HELP = {
+    'mvfi_stage_seconds': ('histogram', 'Durasi tiap stage pipeline (detik)'),
+    'mvfi_encode_speed_ratio': ('histogram', 'Kecepatan encode ffmpeg (x realtime)'),
+    'mvfi_stage_failures_total': ('counter', 'Kegagalan per stage dan penyebab'),
+    'mvfi_bytes_total': ('counter', 'Byte masuk/keluar per stage'),
+    'mvfi_render_jobs_total': ('counter', 'Job render selesai per jenis dan status'),
+    'mvfi_render_queue_depth': ('gauge', 'Job render yang menunggu'),
+    'mvfi_render_jobs': ('gauge', 'Job render di database per status'),
+    'mvfi_web1_deliveries': ('gauge', 'Pengiriman web 1 per status'),
+    'mvfi_used_images': ('gauge', 'Foto di index deteksi foto mirip'),
+}
+
+
+def log_event(event, **fields):
+    """Log terstruktur: satu baris JSON per kejadian ke stderr (LOG_JSON=0 untuk mematikan).
+
+    stderr, bukan stdout, supaya output JSON benchmark.py / CLI batch tetap valid."""
+    if LOG_JSON:
+        record = {'ts': time.strftime('%Y-%m-%dT%H:%M:%S'), 'event': event, 'pid': os.getpid()}
+        record.update((k, v) for k, v in fields.items() if v is not None)
+        print(json.dumps(record, default=str), file=sys.stderr, flush=True)
+
+
+def _escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = collections.defaultdict(float)
+        self._histograms = {}
+        self._started = False
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        with self._lock:
+            self._counters[self._key(name, labels)] += value
+
+    def observe(self, name, value, **labels):
+        buckets = METRIC_BUCKETS[name]
+        with self._lock:
+            h = self._histograms.setdefault(self._key(name, labels), [[0] * len(buckets), 0.0, 0])
+            for i, le in enumerate(buckets):
+                if value <= le:
+                    h[0][i] += 1
+            h[1] += value
+            h[2] += 1
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        threading.Thread(target=self._loop, name='metrics-flush', daemon=True).start()
+
+    def _loop(self):
+        while True:
+            time.sleep(METRICS_FLUSH_INTERVAL)
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                print(f"metrics flush error: {e}")
+
+    def flush(self):
+        with self._lock:
+            data = {
+                'counters': [[n, dict(l), v] for (n, l), v in self._counters.items()],
+                'histograms': [[n, dict(l)] + [list(h[0]), h[1], h[2]] for (n, l), h in self._histograms.items()],
+            }
+        conn = get_db()
+        with conn:
+            conn.execute('INSERT OR REPLACE INTO metrics_snapshots (worker, updated_at, data) VALUES (?, ?, ?)',
+                         (worker_id(), time.time(), json.dumps(data)))
+            conn.execute('DELETE FROM metrics_snapshots WHERE updated_at < ?',
+                         (time.time() - METRICS_STALE_SECONDS,))
+
+    def render(self, gauges):
+        """Teks exposition Prometheus: jumlah snapshot semua proses + gauges [(name, labels, value)]."""
+        counters = collections.defaultdict(float)
+        histograms = {}
+        for row in get_db().execute('SELECT data FROM metrics_snapshots'):
+            data = json.loads(row['data'])
+            for name, labels, value in data['counters']:
+                counters[self._key(name, labels)] += value
+            for name, labels, buckets, total, count in data['histograms']:
+                h = histograms.setdefault(self._key(name, labels), [[0] * len(buckets), 0.0, 0])
+                h[0] = [a + b for a, b in zip(h[0], buckets)]
+                h[1] += total
+                h[2] += count
+        for name, labels, value in gauges:
+            counters[self._key(name, labels)] = value
+
+        def fmt(labels, extra=()):
+            items = list(labels) + list(extra)
+            if not items:
+                return ''
+            return '{' + ','.join(f'{k}="{_escape_label(v)}"' for k, v in items) + '}'
+
+        lines, seen = [], set()
+        for (name, labels), value in sorted(counters.items()):
+            if name not in seen:
+                seen.add(name)
+                kind, text = METRIC_HELP.get(name, ('untyped', name))
+                lines += [f'# HELP {name} {text}', f'# TYPE {name} {kind}']
+            lines.append(f'{name}{fmt(labels)} {value:g}')
+        for (name, labels), (buckets, total, count) in sorted(histograms.items()):
+            if name not in seen:
+                seen.add(name)
+                lines += [f'# HELP {name} {METRIC_HELP[name][1]}', f'# TYPE {name} histogram']
+            for le, c in zip(METRIC_BUCKETS[name], buckets):
+                lines.append(f'{name}_bucket{fmt(labels, [("le", f"{le:g}")])} {c}')
+            lines.append(f'{name}_bucket{fmt(labels, [("le", "+Inf")])} {count}')
+            lines.append(f'{name}_sum{fmt(labels)} {total:g}')
+            lines.append(f'{name}_count{fmt(labels)} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+
+def record_failure(stage, cause, **fields):
+    metrics.inc('mvfi_stage_failures_total', stage=stage, cause=cause)
+    log_event('stage_failed', stage=stage, cause=cause, **fields)
+
+
+@contextlib.contextmanager
+def timed_stage(stage, **fields):
+    """Ukur durasi satu stage -> histogram mvfi_stage_seconds + log JSON.
+
+    Field tambahan bisa diisi di dalam blok lewat dict yang di-yield
+    (mis. bytes, cached); exception dihitung sebagai kegagalan stage.
+    """
+    start = time.time()
+    try:
+        yield fields
+    except Exception as e:
+        record_failure(stage, type(e).__name__, seconds=round(time.time() - start, 3),
+                       error=str(e)[:200], **fields)
+        raise
+    seconds = time.time() - start
+    metrics.observe('mvfi_stage_seconds', seconds, stage=stage)
+    log_event('stage', stage=stage, seconds=round(seconds, 3), **fields)
+
+
 def get_music_folder():
     candidates = [
         os.path.join(BASE_DIR, 'musik'),
@@ -44,23 +751,700 @@ def get_music_folder():
 
 MUSIC_EXTENSIONS = ['.mp3', '.wav', '.flac', '.aac', '.m4a', '.ogg']
 
-progress_store = {}
 
+# ─── PROGRESS STORE ───────────────────────────────────────
+# Progress disimpan di tabel SQLite `progress` supaya semua proses (worker HTTP
+# gunicorn dan `python main.py worker`) melihat state yang sama. Tiap tulis
+# menaikkan `version` global; listener SSE / long-poll di proses yang sama
+# dibangunkan lewat Condition, proses lain ketahuan lewat polling singkat.
+PROGRESS_POLL_INTERVAL = 0.5
+PROGRESS_KEEP_SECONDS = 24 * 3600
+
+
+class ProgressStore:
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._writes = itertools.count()
+
+    def _write(self, task_id, data, merge=False):
+        conn = get_db()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            if merge:
+                row = conn.execute('SELECT data FROM progress WHERE task_id = ?', (task_id,)).fetchone()
+                data = dict(json.loads(row['data']) if row else {}, **data)
+            version = conn.execute('SELECT COALESCE(MAX(version), 0) + 1 FROM progress').fetchone()[0]
+            conn.execute('INSERT OR REPLACE INTO progress (task_id, version, updated_at, data) VALUES (?, ?, ?, ?)',
+                         (task_id, version, time.time(), json.dumps(data)))
+            if next(self._writes) % 500 == 0:
+                conn.execute('DELETE FROM progress WHERE updated_at < ?', (time.time() - PROGRESS_KEEP_SECONDS,))
+        with self._cond:
+            self._cond.notify_all()
+
+    def get(self, task_id, default=None):
+        row = get_db().execute('SELECT data FROM progress WHERE task_id = ?', (task_id,)).fetchone()
+        return json.loads(row['data']) if row else default
+
+    def set(self, task_id, data):
+        self._write(task_id, dict(data))
+
+    def update(self, task_id, **fields):
+        self._write(task_id, fields, merge=True)
+
+    def changes(self, task_ids, since):
+        """Task (dari task_ids, None = semua) yang berubah setelah versi `since`."""
+        conn = get_db()
+        version = conn.execute('SELECT COALESCE(MAX(version), 0) FROM progress').fetchone()[0]
+        sql, params = self._filter(task_ids, since)
+        rows = conn.execute(f'SELECT task_id, data FROM progress WHERE {sql}', params)
+        return {r['task_id']: json.loads(r['data']) for r in rows}, version
+
+    def wait(self, task_ids, since, timeout):
+        """Tunggu sampai ada task yang berubah setelah `since`; False kalau timeout."""
+        deadline = time.time() + timeout
+        sql, params = self._filter(task_ids, since)
+        while True:
+            if get_db().execute(f'SELECT 1 FROM progress WHERE {sql} LIMIT 1', params).fetchone():
+                return True
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False
+            with self._cond:
+                self._cond.wait(min(PROGRESS_POLL_INTERVAL, remaining))
+
+    @staticmethod
+    def _filter(task_ids, since):
+        if task_ids is None:
+            return 'version > ?', (since,)
+        task_ids = list(task_ids)
+        marks = ','.join('?' * len(task_ids)) or "''"
+        return f'version > ? AND task_id IN ({marks})', (since, *task_ids)
+
+
+progress_store = ProgressStore()
+
+
+# ─── RENDER QUEUE ─────────────────────────────────────────
+# Semua render lewat antrian ini supaya jumlah ffmpeg yang jalan barengan
+# dibatasi (default: seperempat jumlah core, libx264 sendiri sudah multi-thread).
+# Job disimpan di tabel render_jobs, jadi proses web bisa submit sementara
+# proses lain (`python main.py worker`) yang mengerjakan; job diambil dengan
+# UPDATE di dalam transaksi supaya satu job tidak dikerjakan dua worker.
+RENDER_JOBS_FILE = os.path.join(BASE_DIR, 'render_jobs.json')  # format lama, dimigrasi ke SQLite
+RENDER_WORKERS = int(os.environ.get('RENDER_WORKERS', max(1, (os.cpu_count() or 1) // 4)))
+RENDER_MAX_ATTEMPTS = 3
+RENDER_KEEP_FINISHED = 200
+RENDER_POLL_INTERVAL = 1     # detik, cek job baru dari proses lain
+RENDER_HEARTBEAT = 10        # detik, worker memperbarui heartbeat_at job yang dikerjakan
+RENDER_LEASE_SECONDS = 60    # job 'running' tanpa heartbeat selama ini dianggap yatim
+RENDER_PRIORITY_RANGE = (0, 9)  # angka kecil dikerjakan dulu, default 5
+
+
+def parse_priority(value):
+    """Prioritas job dari request, dibatasi ke RENDER_PRIORITY_RANGE; ValueError kalau bukan angka."""
+    if value is None or value == '':
+        return 5
+    if isinstance(value, bool):
+        raise ValueError('priority harus angka')
+    try:
+        priority = int(value)
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError('priority harus angka') from None
+    low, high = RENDER_PRIORITY_RANGE
+    return max(low, min(high, priority))
+
+
+class RenderQueue:
+    """Antrian render dengan worker terbatas; job record di tabel render_jobs.
+
+    Job 'running' yang workernya mati (proses di host ini sudah tidak ada,
+    atau heartbeat berhenti) dikembalikan ke 'queued' oleh worker mana pun.
+    """
+
+    def __init__(self, workers):
+        self.workers = max(1, workers)
+        self.autostart = True
+        self.active = 0
+        self._cond = threading.Condition()
+        self._lock = threading.Lock()
+        self._started = False
+
+    @staticmethod
+    def _row(row):
+        job = dict(row)
+        job['args'] = json.loads(job['args'])
+        return job
+
+    def _set_queued(self, job_id, kind):
+        progress_store.set(job_id, {
+            'status': 'queued', 'progress': 0,
+            'message': 'Menunggu antrian render...', 'type': kind,
+        })
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        self.reclaim()
+        encoder_tuner.start()
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker, name=f'render-{i}', daemon=True)
+            t.start()
+        threading.Thread(target=self._heartbeat, name='render-heartbeat', daemon=True).start()
+
+    def submit(self, kind, task_id, args, priority=5, render_cache=None):
+        """Masukkan job ke antrian; return dict job.
+
+        render_cache=(key, filename): job + entry render_cache ditulis dalam satu
+        transaksi, dan kalau key sudah ada (proses lain lebih dulu) tidak ada yang
+        ditulis dan hasilnya None.
+        """
+        if self.autostart:
+            self.start()
+        job = {
+            'id': task_id,
+            'kind': kind,
+            'args': list(args),
+            'priority': int(priority),
+            'status': 'queued',
+            'attempts': 0,
+            'created_at': time.time(),
+            'started_at': None,
+            'finished_at': None,
+            'error': None,
+        }
+        self._set_queued(task_id, kind)
+        conn = get_db()
+        with conn:
+            if render_cache:
+                conn.execute('BEGIN IMMEDIATE')
+                key, filename = render_cache
+                if conn.execute('SELECT 1 FROM render_cache WHERE key = ?', (key,)).fetchone():
+                    return None
+                conn.execute('INSERT INTO render_cache (key, task_id, filename, created_at) VALUES (?, ?, ?, ?)',
+                             (key, task_id, filename, time.strftime('%Y-%m-%d %H:%M:%S')))
+            conn.execute(
+                'INSERT INTO render_jobs (id, kind, args, priority, status, attempts, created_at) '
+                "VALUES (?, ?, ?, ?, 'queued', 0, ?)",
+                (task_id, kind, json.dumps(job['args']), job['priority'], job['created_at'])
+            )
+        with self._cond:
+            self._cond.notify()
+        return job
+
+    def get(self, job_id):
+        row = get_db().execute('SELECT * FROM render_jobs WHERE id = ?', (job_id,)).fetchone()
+        return self._row(row) if row else None
+
+    def list(self):
+        rows = get_db().execute('SELECT * FROM render_jobs ORDER BY created_at DESC')
+        return [self._row(r) for r in rows]
+
+    def stats(self):
+        rows = get_db().execute('SELECT status, COUNT(*) AS n FROM render_jobs GROUP BY status')
+        counts = {r['status']: r['n'] for r in rows}
+        return {'workers': self.workers, 'active': self.active, 'counts': counts,
+                'queue_depth': counts.get('queued', 0)}
+
+    def reclaim(self):
+        """Kembalikan job 'running' yang workernya mati ke antrian (atau error kalau percobaan habis)."""
+        conn = get_db()
+        stale_before = time.time() - RENDER_LEASE_SECONDS
+        rows = conn.execute("SELECT id, kind, attempts, worker, heartbeat_at FROM render_jobs "
+                            "WHERE status = 'running'").fetchall()
+        for r in rows:
+            if worker_alive(r['worker']) and (r['heartbeat_at'] or 0) >= stale_before:
+                continue
+            with conn:
+                if r['attempts'] >= RENDER_MAX_ATTEMPTS:
+                    cur = conn.execute(
+                        "UPDATE render_jobs SET status = 'error', finished_at = ?, "
+                        "error = 'Proses berhenti saat render (percobaan habis)' "
+                        "WHERE id = ? AND status = 'running' AND worker IS ?",
+                        (time.time(), r['id'], r['worker']))
+                else:
+                    cur = conn.execute(
+                        "UPDATE render_jobs SET status = 'queued', worker = NULL "
+                        "WHERE id = ? AND status = 'running' AND worker IS ?",
+                        (r['id'], r['worker']))
+            if cur.rowcount and r['attempts'] < RENDER_MAX_ATTEMPTS:
+                self._set_queued(r['id'], r['kind'])
+
+    def _claim(self):
+        conn = get_db()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            # batas render barengan berlaku untuk semua proses (worker gunicorn + `main.py worker`),
+            # dihitung di transaksi yang sama supaya dua proses tidak lolos bersamaan
+            counts = dict(conn.execute("SELECT status, COUNT(*) FROM render_jobs "
+                                       "WHERE status IN ('queued', 'running') GROUP BY status").fetchall())
+            if counts.get('running', 0) >= encoder_tuner.concurrency(counts.get('queued', 0)):
+                return None
+            row = conn.execute("SELECT * FROM render_jobs WHERE status = 'queued' "
+                               'ORDER BY priority, created_at LIMIT 1').fetchone()
+            if not row:
+                return None
+            now = time.time()
+            conn.execute("UPDATE render_jobs SET status = 'running', attempts = attempts + 1, "
+                         'started_at = ?, heartbeat_at = ?, worker = ? WHERE id = ?',
+                         (now, now, worker_id(), row['id']))
+        return self._row(row)
+
+    def running(self):
+        """Job 'running' di semua proses yang memakai database ini."""
+        return get_db().execute("SELECT COUNT(*) FROM render_jobs WHERE status = 'running'").fetchone()[0]
+
+    def _finish(self, job_id, status, error):
+        conn = get_db()
+        with conn:
+            conn.execute('UPDATE render_jobs SET status = ?, error = ?, finished_at = ? WHERE id = ?',
+                         (status, error, time.time(), job_id))
+            conn.execute(
+                "DELETE FROM render_jobs WHERE status IN ('done', 'error') AND id NOT IN ("
+                "SELECT id FROM render_jobs WHERE status IN ('done', 'error') "
+                'ORDER BY finished_at DESC LIMIT ?)', (RENDER_KEEP_FINISHED,)
+            )
 
-def get_music_duration(music_path):
+    def _heartbeat(self):
+        while True:
+            time.sleep(RENDER_HEARTBEAT)
+            try:
+                conn = get_db()
+                with conn:
+                    conn.execute("UPDATE render_jobs SET heartbeat_at = ? WHERE status = 'running' AND worker = ?",
+                                 (time.time(), worker_id()))
+                self.reclaim()
+            except sqlite3.Error as e:
+                print(f"render heartbeat error: {e}")
+
+    def _worker(self):
+        # tunggu kalibrasi encoder (hanya lama di start pertama per mesin)
+        encoder_tuner.ready.wait(AUTOTUNE_CALIBRATION_TIMEOUT)
+        while True:
+            with self._cond:
+                if self.active >= encoder_tuner.concurrency(self.stats()['queue_depth']):
+                    self._cond.wait(RENDER_POLL_INTERVAL)
+                    continue
+                self.active += 1
+            job = self._claim()
+            if job is None:
+                self._release()
+                with self._cond:
+                    self._cond.wait(RENDER_POLL_INTERVAL)
+                continue
+            job_id = job['id']
+            wait = max(0.0, time.time() - job['created_at'])
+            metrics.observe('mvfi_stage_seconds', wait, stage='queue_wait')
+            log_event('job_started', task_id=job_id, kind=job['kind'], queue_wait=round(wait, 3),
+                      attempt=job['attempts'] + 1)
+            try:
+                RENDER_TASKS[job['kind']](job_id, *job['args'])
+                result = progress_store.get(job_id, {})
+                status = 'done' if result.get('status') == 'done' else 'error'
+                error = result.get('message') if status == 'error' else None
+            except Exception as e:
+                status, error = 'error', str(e)
+                progress_store.set(job_id, {'status': 'error', 'message': error, 'type': job['kind']})
+            self._finish(job_id, status, error)
+            metrics.inc('mvfi_render_jobs_total', kind=job['kind'], status=status)
+            log_event('job_finished', task_id=job_id, kind=job['kind'], status=status, error=error)
+            self._release()
+
+    def _release(self):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify_all()
+
+
+render_queue = RenderQueue(RENDER_WORKERS)
+
+
+def probe_music(music_path):
+    """Ambil durasi, codec, bitrate & sample rate track audio lewat ffprobe."""
+    start = time.time()
     try:
         result = subprocess.run([
             'ffprobe', '-v', 'error',
-            '-show_entries', 'format=duration',
+            '-select_streams', 'a:0',
+            '-show_entries', 'format=duration,bit_rate:stream=codec_name,sample_rate,bit_rate',
             '-of', 'json',
             music_path
         ], capture_output=True, text=True, timeout=30)
         data = json.loads(result.stdout)
-        duration = float(data['format']['duration'])
-        return duration
+        fmt = data.get('format', {})
+        stream = (data.get('streams') or [{}])[0]
+        info = {
+            'duration': float(fmt['duration']),
+            'codec': stream.get('codec_name', ''),
+            'bitrate': int(stream.get('bit_rate') or fmt.get('bit_rate') or 0),
+            'sample_rate': int(stream.get('sample_rate') or 0),
+        }
     except Exception as e:
         print(f"ffprobe error: {e}")
+        record_failure('music_probe', type(e).__name__, file=os.path.basename(music_path))
         return None
+    seconds = time.time() - start
+    metrics.observe('mvfi_stage_seconds', seconds, stage='music_probe')
+    log_event('stage', stage='music_probe', seconds=round(seconds, 3), file=os.path.basename(music_path))
+    return info
+
+
+# ─── MUSIC INDEX ──────────────────────────────────────────
+# Cache metadata musik (key: path + mtime + size) supaya /music-list dan render
+# tidak perlu ffprobe tiap kali. Diisi di background, folder dicek lewat mtime.
+MUSIC_INDEX_FILE = os.path.join(BASE_DIR, 'music_index.json')
+MUSIC_INDEX_INTERVAL = 30  # detik, rescan berkala untuk file yang diedit di tempat
+
+
+def list_music_files(music_folder):
+    music_files = []
+    for ext in MUSIC_EXTENSIONS:
+        music_files.extend(glob.glob(os.path.join(music_folder, f'*{ext}')))
+        music_files.extend(glob.glob(os.path.join(music_folder, f'*{ext.upper()}')))
+    return sorted(set(music_files))
+
+
+class MusicIndex:
+    def __init__(self, index_file):
+        self.index_file = index_file
+        self._entries = {}
+        self._folder_state = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._started = False
+
+    def _load(self):
+        if not os.path.exists(self.index_file):
+            return {}
+        try:
+            with open(self.index_file) as f:
+                return json.load(f)
+        except:
+            return {}
+
+    def _save(self):
+        # dipanggil dari thread request dan thread music-index: nama tmp unik per
+        # panggilan, dump + replace di bawah lock supaya file tidak setengah jadi
+        tmp = f'{self.index_file}.{uuid.uuid4().hex}.tmp'
+        with self._lock:
+            with open(tmp, 'w') as f:
+                json.dump(self._entries, f, indent=2)
+            os.replace(tmp, self.index_file)
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            self._entries = self._load()
+        threading.Thread(target=self._loop, name='music-index', daemon=True).start()
+
+    def _loop(self):
+        while True:
+            try:
+                self.refresh()
+                self.analyze_loudness()
+            except Exception as e:
+                print(f"music index error: {e}")
+            self._wake.wait(MUSIC_INDEX_INTERVAL)
+            self._wake.clear()
+
+    def _folder_changed(self, folder):
+        try:
+            state = (folder, os.stat(folder).st_mtime)
+        except OSError:
+            return True
+        return state != self._folder_state
+
+    def refresh(self):
+        """Scan folder musik, probe file baru/berubah, buang file yang hilang."""
+        folder = get_music_folder()
+        folder_mtime = os.stat(folder).st_mtime
+        paths = list_music_files(folder)
+        changed = False
+        for path in paths:
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            with self._lock:
+                cur = self._entries.get(path)
+            if cur and cur['mtime'] == st.st_mtime and cur['size'] == st.st_size:
+                continue
+            if cur and cur.get('sha256'):
+                audio_cache.discard(cur['sha256'])
+            info = probe_music(path) or {'duration': None, 'codec': '', 'bitrate': 0, 'sample_rate': 0}
+            info.update({'name': os.path.basename(path), 'mtime': st.st_mtime, 'size': st.st_size})
+            with self._lock:
+                self._entries[path] = info
+            changed = True
+        alive = set(paths)
+        with self._lock:
+            for path in [p for p in self._entries if p not in alive]:
+                removed = self._entries.pop(path)
+                if removed.get('sha256'):
+                    audio_cache.discard(removed['sha256'])
+                changed = True
+            self._folder_state = (folder, folder_mtime)
+        if changed:
+            self._save()
+
+    def analyze_loudness(self):
+        """Ukur loudness track yang belum punya (hasil per hash isi di tabel loudness)."""
+        with self._lock:
+            pending = [p for p, e in self._entries.items() if 'loudness' not in e]
+        changed = False
+        for path in pending:
+            loudness = track_loudness(path)
+            with self._lock:
+                cur = self._entries.get(path)
+                if cur is not None:
+                    cur['loudness'] = loudness
+                    changed = True
+        if changed:
+            self._save()
+
+    def files(self):
+        """Daftar track dari memory; file baru yang belum di-probe ikut tampil tanpa metadata."""
+        self.start()
+        folder = get_music_folder()
+        if self._folder_changed(folder):
+            self._wake.set()
+        result = []
+        with self._lock:
+            for path in list_music_files(folder):
+                entry = self._entries.get(path)
+                if entry is None:
+                    self._wake.set()
+                    entry = {'name': os.path.basename(path), 'duration': None,
+                             'codec': '', 'bitrate': 0, 'sample_rate': 0}
+                result.append(dict(entry, path=path))
+        return result
+
+    def get(self, music_path):
+        """Metadata satu track; di-probe langsung kalau belum ada / sudah basi."""
+        self.start()
+        try:
+            st = os.stat(music_path)
+        except OSError:
+            return None
+        with self._lock:
+            cur = self._entries.get(music_path)
+        if cur and cur['mtime'] == st.st_mtime and cur['size'] == st.st_size:
+            return dict(cur)
+        info = probe_music(music_path)
+        if info is None:
+            return None
+        info.update({'name': os.path.basename(music_path), 'mtime': st.st_mtime, 'size': st.st_size})
+        with self._lock:
+            self._entries[music_path] = info
+        self._save()
+        return dict(info)
+
+    def duration(self, music_path):
+        info = self.get(music_path)
+        return info['duration'] if info else None
+
+    def content_hash(self, music_path):
+        """sha256 isi file, dihitung sekali per versi (mtime + size) file."""
+        info = self.get(music_path)
+        if info is None:
+            return None
+        if not info.get('sha256'):
+            info['sha256'] = file_sha256(music_path)
+            with self._lock:
+                cur = self._entries.get(music_path)
+                if cur and cur['mtime'] == info['mtime'] and cur['size'] == info['size']:
+                    cur['sha256'] = info['sha256']
+            self._save()
+        return info['sha256']
+
+
+music_index = MusicIndex(MUSIC_INDEX_FILE)
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def prune_cache_folder(folder, max_bytes, pattern='*'):
+    """Hapus file paling lama tidak dipakai (mtime) sampai total ukuran <= max_bytes."""
+    files = []
+    for f in glob.glob(os.path.join(folder, pattern)):
+        if '.tmp' in os.path.basename(f):
+            continue
+        try:
+            st = os.stat(f)
+        except OSError:
+            continue
+        files.append((st.st_mtime, st.st_size, f))
+    total = sum(size for _, size, _ in files)
+    for _, size, f in sorted(files):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(f)
+            total -= size
+        except OSError:
+            pass
+
+
+# ─── LOUDNESS ─────────────────────────────────────────────
+# Loudness tiap track (integrated, true peak, LRA) diukur sekali dengan pass
+# analisis loudnorm dan disimpan di tabel loudness per sha256 isi file + target
+# (target_offset tergantung I/TP/LRA). Audio
+# cache lalu menormalkan track dalam satu pass memakai angka yang sudah diukur
+# (loudnorm linear), jadi render tidak perlu analisis dua pass per job.
+LOUDNORM = os.environ.get('LOUDNORM', '1') == '1'
+LOUDNORM_I = float(os.environ.get('LOUDNORM_I', -14))      # target LUFS
+LOUDNORM_TP = float(os.environ.get('LOUDNORM_TP', -1.5))   # batas true peak dBTP
+LOUDNORM_LRA = float(os.environ.get('LOUDNORM_LRA', 11))
+LOUDNORM_SAMPLE_RATE = 48000  # loudnorm resample ke 192k, output dikembalikan ke sini
+_loudness_lock = threading.Lock()
+_loudness_key_locks = {}
+
+
+def loudnorm_key():
+    """Target loudnorm aktif, bagian dari key tabel loudness dan nama file audio cache."""
+    return f'I{LOUDNORM_I:g}_TP{LOUDNORM_TP:g}_LRA{LOUDNORM_LRA:g}'
+
+
+def measure_loudness(music_path):
+    """Pass analisis loudnorm; return dict integrated/true_peak/lra/threshold/offset atau None."""
+    with timed_stage('loudness_analysis', file=os.path.basename(music_path)):
+        result = subprocess.run([
+            'ffmpeg', '-hide_banner', '-nostats',
+            '-i', music_path,
+            '-map', '0:a:0', '-vn',
+            '-af', f'loudnorm=I={LOUDNORM_I}:TP={LOUDNORM_TP}:LRA={LOUDNORM_LRA}:print_format=json',
+            '-f', 'null', '-'
+        ], capture_output=True, text=True)
+    start = result.stderr.rfind('{')
+    if result.returncode != 0 or start < 0:
+        print(f"loudness error {os.path.basename(music_path)}: {result.stderr[-300:]}")
+        return None
+    try:
+        data = json.loads(result.stderr[start:result.stderr.rfind('}') + 1])
+        values = {
+            'integrated': float(data['input_i']),
+            'true_peak': float(data['input_tp']),
+            'lra': float(data['input_lra']),
+            'threshold': float(data['input_thresh']),
+            'offset': float(data['target_offset']),
+        }
+    except (KeyError, ValueError) as e:
+        print(f"loudness parse error {os.path.basename(music_path)}: {e}")
+        return None
+    # track hening: -inf tidak bisa dinormalkan, disimpan apa adanya sebagai None
+    return {k: (round(v, 2) if math.isfinite(v) else None) for k, v in values.items()}
+
+
+def track_loudness(music_path, measure=True):
+    """Loudness track dari cache (per hash isi file + target); diukur sekali kalau belum ada."""
+    sha = music_index.content_hash(music_path)
+    if not sha:
+        return None
+    key = f'{sha}:{loudnorm_key()}'
+    cached = get_loudness(key)
+    if cached is not None or not measure:
+        return cached or None
+    with _loudness_lock:
+        key_lock = _loudness_key_locks.setdefault(key, threading.Lock())
+    with key_lock:
+        cached = get_loudness(key)
+        if cached is None:
+            cached = measure_loudness(music_path) or {}
+            set_loudness(key, cached)  # {} = gagal diukur, tidak dicoba ulang tiap render
+    return cached or None
+
+
+def loudnorm_filter(loudness):
+    """Filter loudnorm satu pass dari hasil track_loudness, None kalau tidak bisa dipakai."""
+    if not LOUDNORM or not loudness or None in loudness.values():
+        return None
+    return (f"loudnorm=I={LOUDNORM_I}:TP={LOUDNORM_TP}:LRA={LOUDNORM_LRA}"
+            f":measured_I={loudness['integrated']}:measured_TP={loudness['true_peak']}"
+            f":measured_LRA={loudness['lra']}:measured_thresh={loudness['threshold']}"
+            f":offset={loudness['offset']}:linear=true:print_format=none")
+
+
+# ─── AUDIO CACHE ──────────────────────────────────────────
+# Tiap track cukup di-encode ke AAC sekali; render berikutnya tinggal
+# -c:a copy. Nama file = hash isi track, jadi file yang diganti otomatis
+# dapat entry baru. Ukuran total dibatasi, yang paling lama tidak dipakai dibuang.
+AUDIO_CACHE_FOLDER = os.path.join(BASE_DIR, 'cache', 'audio')
+AUDIO_CACHE_MAX_MB = int(os.environ.get('AUDIO_CACHE_MAX_MB', 500))
+AUDIO_BITRATE = '192k'
+
+
+class AudioCache:
+    def __init__(self, folder, max_bytes):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def _path(self, sha, normalized=False):
+        suffix = f'_ln{loudnorm_key()}' if normalized else ''
+        return os.path.join(self.folder, f'{sha[:32]}_{AUDIO_BITRATE}{suffix}.m4a')
+
+    def _key_lock(self, sha):
+        with self._lock:
+            return self._key_locks.setdefault(sha, threading.Lock())
+
+    def get(self, music_path):
+        """Path m4a hasil cache untuk track ini, atau None kalau encode gagal.
+
+        Dengan LOUDNORM, track dinormalkan (satu pass, angka dari track_loudness).
+        """
+        sha = music_index.content_hash(music_path)
+        if not sha:
+            return None
+        af = loudnorm_filter(track_loudness(music_path)) if LOUDNORM else None
+        path = self._path(sha, normalized=bool(af))
+        with self._key_lock(sha):
+            if os.path.exists(path):
+                os.utime(path)  # tandai baru dipakai (LRU)
+                return path
+            os.makedirs(self.folder, exist_ok=True)
+            tmp = f'{path}.{os.getpid()}.tmp.m4a'
+            start = time.time()
+            cmd = ['ffmpeg', '-y', '-v', 'error', '-i', music_path, '-map', '0:a:0', '-vn']
+            if af:
+                cmd += ['-af', af, '-ar', str(LOUDNORM_SAMPLE_RATE)]
+            cmd += ['-c:a', 'aac', '-b:a', AUDIO_BITRATE, tmp]
+            result = subprocess.run(cmd, capture_output=True, text=True)
+            if result.returncode != 0 or not os.path.exists(tmp):
+                print(f"audio cache error: {result.stderr[-300:]}")
+                record_failure('audio_encode', 'ffmpeg_exit', file=os.path.basename(music_path))
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+                return None
+            os.replace(tmp, path)
+            seconds = time.time() - start
+            metrics.observe('mvfi_stage_seconds', seconds, stage='audio_encode')
+            log_event('stage', stage='audio_encode', seconds=round(seconds, 3),
+                      file=os.path.basename(music_path), bytes=os.path.getsize(path))
+        self.prune()
+        return path
+
+    def discard(self, sha):
+        for normalized in (False, True):
+            path = self._path(sha, normalized)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def prune(self):
+        with self._lock:
+            prune_cache_folder(self.folder, self.max_bytes, '*.m4a')
+
+
+audio_cache = AudioCache(AUDIO_CACHE_FOLDER, AUDIO_CACHE_MAX_MB * 1024 * 1024)
 
 
 def get_image_size(image_path):
@@ -68,99 +1452,1032 @@ def get_image_size(image_path):
         return img.size
 
 
-def make_1080p_size(width, height):
+def make_short_side_size(width, height, short_side):
+    """Skala (width, height) supaya sisi pendek = short_side, hasil genap."""
     if width >= height:
-        new_h = 1080
-        new_w = int(width * 1080 / height)
+        new_h = short_side
+        new_w = int(width * short_side / height)
     else:
-        new_w = 1080
-        new_h = int(height * 1080 / width)
+        new_w = short_side
+        new_h = int(height * short_side / width)
     new_w = new_w if new_w % 2 == 0 else new_w + 1
     new_h = new_h if new_h % 2 == 0 else new_h + 1
     return new_w, new_h
 
 
-def create_video_task(task_id, image_path, music_path, output_path):
+def make_1080p_size(width, height):
+    return make_short_side_size(width, height, 1080)
+
+
+# ─── IMAGE PREPROCESS ─────────────────────────────────────
+# Foto di-decode sekali di Pillow (orientasi EXIF, RGB, resize ke ukuran
+# make_1080p_size) lalu disimpan di cache/frames per hash isi file, jadi
+# ffmpeg menerima frame yang sudah pas ukurannya dan tidak perlu scale lagi.
+FRAME_CACHE_FOLDER = os.path.join(BASE_DIR, 'cache', 'frames')
+FRAME_CACHE_MAX_MB = int(os.environ.get('FRAME_CACHE_MAX_MB', 500))
+_frame_lock = threading.Lock()
+
+
+def prepare_frame(image_path, size=None):
+    """Return (path frame siap encode, (w, h)).
+
+    size: (w, h), fungsi (w, h) sumber setelah orientasi EXIF -> (w, h),
+    atau None -> make_1080p_size.
+    """
+    sha = file_sha256(image_path)
+    with Image.open(image_path) as img:
+        w, h = img.size
+        orientation = img.getexif().get(0x0112, 1)
+        rotated = orientation in (5, 6, 7, 8)
+        if rotated:
+            w, h = h, w
+        if callable(size):
+            new_w, new_h = size(w, h)
+        else:
+            new_w, new_h = size or make_1080p_size(w, h)
+        frame_path = os.path.join(FRAME_CACHE_FOLDER, f'{sha[:32]}_{new_w}x{new_h}.png')
+        if os.path.exists(frame_path):
+            os.utime(frame_path)
+            return frame_path, (new_w, new_h)
+        with timed_stage('image_prepare', size=f'{new_w}x{new_h}'):
+            # JPEG besar: decode langsung di skala 1/2, 1/4, 1/8 yang masih >= target
+            img.draft('RGB', (new_h, new_w) if rotated else (new_w, new_h))
+            img = ImageOps.exif_transpose(img)
+            if img.mode != 'RGB':
+                img = img.convert('RGB')
+            if img.size != (new_w, new_h):
+                img = img.resize((new_w, new_h), Image.Resampling.LANCZOS)
+            os.makedirs(FRAME_CACHE_FOLDER, exist_ok=True)
+            tmp = f'{frame_path}.{uuid.uuid4().hex}.tmp'
+            img.save(tmp, 'PNG', compress_level=1)
+            os.replace(tmp, frame_path)
+    with _frame_lock:
+        prune_cache_folder(FRAME_CACHE_FOLDER, FRAME_CACHE_MAX_MB * 1024 * 1024, '*.png')
+    return frame_path, (new_w, new_h)
+
+
+# ─── DUPLICATE INDEX ──────────────────────────────────────
+# dHash 64-bit tiap foto yang sudah dijadikan video disimpan di used_images;
+# tiap proses memegang HammingIndex di memory (disinkron lewat seq) supaya cari
+# foto mirip (jarak Hamming <= DHASH_MAX_DISTANCE) cukup beberapa milidetik
+# walau isinya puluhan ribu. Hash gambar Pinterest dicatat per URL saat
+# di-download (tabel image_dhash), jadi URL CDN / ukuran lain dari foto yang
+# sama tetap ketahuan.
+DHASH_MAX_DISTANCE = int(os.environ.get('DHASH_MAX_DISTANCE', 6))
+DHASH_BACKFILL_RETRY = 600  # detik, jeda sebelum video lama yang gagal di-hash dicoba lagi
+
+
+def _to_int64(value):
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _from_int64(value):
+    return value + (1 << 64) if value < 0 else value
+
+
+def image_dhash(source):
+    """dHash 64-bit (gradien horizontal 9x8 grayscale) dari path / file object / Image."""
+    img = source if isinstance(source, Image.Image) else Image.open(source)
     try:
-        progress_store[task_id] = {'status': 'processing', 'progress': 0, 'message': 'Memulai proses...'}
+        img.draft('L', (64, 64))
+        small = ImageOps.exif_transpose(img).convert('L').resize((9, 8), Image.Resampling.BOX)
+        px = list(small.getdata())
+    finally:
+        if img is not source:
+            img.close()
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = (value << 1) | (px[row * 9 + col] > px[row * 9 + col + 1])
+    return value
+
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+
+def get_image_dhash(key):
+    row = get_db().execute('SELECT dhash FROM image_dhash WHERE key = ?', (key,)).fetchone()
+    return _from_int64(row['dhash']) if row else None
+
+
+def set_image_dhash(key, value):
+    conn = get_db()
+    with conn:
+        conn.execute('INSERT OR REPLACE INTO image_dhash (key, dhash) VALUES (?, ?)', (key, _to_int64(value)))
+
+
+class HammingIndex:
+    """Multi-index hashing untuk hash 64-bit: dipecah jadi max_distance+1 potongan.
+
+    Dua hash berjarak <= max_distance pasti sama persis di minimal satu potongan
+    (pigeonhole), jadi kandidat cukup diambil dari bucket potongan yang sama
+    lalu dicek jaraknya; jauh lebih sedikit node dikunjungi daripada BK-tree
+    di radius 6 pada 64 bit.
+    """
+
+    def __init__(self, max_distance):
+        self.max_distance = max_distance
+        bands = max_distance + 1
+        widths = [64 // bands + (1 if i < 64 % bands else 0) for i in range(bands)]
+        self._bands = []
+        shift = 0
+        for width in widths:
+            self._bands.append((shift, (1 << width) - 1))
+            shift += width
+        self._buckets = [collections.defaultdict(list) for _ in self._bands]
+        self.size = 0
+
+    def add(self, value, item):
+        self.size += 1
+        for (shift, mask), buckets in zip(self._bands, self._buckets):
+            buckets[(value >> shift) & mask].append((value, item))
+
+    def search(self, value):
+        """List (jarak, item) dengan jarak <= max_distance."""
+        found = {}
+        for (shift, mask), buckets in zip(self._bands, self._buckets):
+            for other, item in buckets.get((value >> shift) & mask, ()):
+                if item not in found:
+                    d = hamming(value, other)
+                    if d <= self.max_distance:
+                        found[item] = d
+        return [(d, item) for item, d in found.items()]
+
+
+class DuplicateIndex:
+    def __init__(self, max_distance):
+        self.max_distance = max_distance
+        self._tree = HammingIndex(max_distance)
+        self._last_seq = 0
+        self._lock = threading.Lock()
+        self._started = False
+
+    def start(self):
+        """Isi index dari video lama (sekali per database) di background."""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        threading.Thread(target=self._backfill, name='duplicate-backfill', daemon=True).start()
+
+    def _backfill(self):
+        """Ulangi sampai semua video lama tertangani; flag meta baru ditulis setelah itu."""
+        while True:
+            try:
+                if self._backfill_pass():
+                    return
+            except Exception as e:
+                print(f"duplicate index backfill error: {e}")
+            time.sleep(DHASH_BACKFILL_RETRY)
+
+    def _backfill_pass(self):
+        conn = get_db()
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'used_images_backfill'").fetchone():
+            return True
+        done = {r[0] for r in conn.execute('SELECT DISTINCT video_id FROM used_images')}
+        rows = conn.execute('SELECT id, thumb_url, data FROM videos WHERE id IS NOT NULL ORDER BY seq').fetchall()
+        failed = 0
+        for row in rows:
+            if row['id'] in done:
+                continue
+            done.add(row['id'])  # rendition lain dari job yang sama
+            try:
+                path = self._backfill_source(row['id'], json.loads(row['data']), row['thumb_url'])
+            except Exception as e:
+                failed += 1
+                print(f"duplicate index backfill {row['id']}: {e}")
+                continue
+            if path:
+                self.add(row['id'], path, row['thumb_url'])
+        if failed:
+            print(f"duplicate index backfill: {failed} video dicoba lagi dalam {DHASH_BACKFILL_RETRY} dtk")
+            return False
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('used_images_backfill', ?)",
+                         (time.strftime('%Y-%m-%d %H:%M:%S'),))
+        return True
+
+    @staticmethod
+    def _backfill_source(video_id, entry, thumb_url):
+        """Gambar untuk di-hash: foto upload, gambar Pinterest (download kalau perlu),
+        atau poster (dibuat dari frame mp4 untuk entry lama). None = memang tidak ada
+        sumbernya; exception = gagal sementara, dicoba lagi pass berikutnya."""
+        path = find_media([UPLOAD_FOLDER], entry.get('image') or '')
+        if path:
+            return path
+        fetch_error = None
+        if thumb_url.startswith(('http://', 'https://')):
+            try:
+                return pin_image_cache.fetch(thumb_url)
+            except urllib.error.HTTPError as e:
+                if e.code >= 500:
+                    fetch_error = e  # 4xx: pin sudah hilang, pakai poster saja
+            except Exception as e:
+                fetch_error = e
+        poster = thumb_path(video_id, 'lg')
+        if os.path.exists(poster) or build_missing_thumbnails(video_id, entry):
+            return poster
+        if fetch_error:
+            raise fetch_error
+        return None
+
+    def _sync(self):
+        """Masukkan baris used_images baru (dari proses mana pun) ke index memory."""
+        rows = get_db().execute('SELECT seq, video_id, dhash, thumb_url FROM used_images WHERE seq > ? '
+                                'ORDER BY seq', (self._last_seq,)).fetchall()
+        with self._lock:
+            for r in rows:
+                if r['seq'] > self._last_seq:
+                    self._tree.add(_from_int64(r['dhash']), r['seq'])
+                    self._last_seq = r['seq']
+
+    def add(self, video_id, image_path, thumb_url=''):
+        """Catat foto sumber video_id; error baca gambar tidak menggagalkan render."""
+        try:
+            sha = file_sha256(image_path)
+            value = get_image_dhash(f'sha:{sha}')
+            if value is None:
+                value = image_dhash(image_path)
+                set_image_dhash(f'sha:{sha}', value)
+            conn = get_db()
+            with conn:
+                conn.execute('INSERT OR IGNORE INTO used_images (video_id, dhash, image_sha, thumb_url, created_at) '
+                             'VALUES (?, ?, ?, ?, ?)', (video_id, _to_int64(value), sha, thumb_url or '',
+                                                        time.strftime('%Y-%m-%d %H:%M:%S')))
+        except (OSError, ValueError, sqlite3.Error) as e:
+            print(f"duplicate index add error {video_id}: {e}")
+
+    def remove(self, video_id):
+        """Hapus foto video_id dari index (entry lama di memory tersaring saat lookup)."""
+        conn = get_db()
+        with conn:
+            conn.execute('DELETE FROM used_images WHERE video_id = ?', (video_id,))
+
+    def find(self, value):
+        """Video terdekat yang fotonya mirip: dict video_id/thumb_url/image_sha/distance, atau None."""
+        if value is None or value in (0, (1 << 64) - 1):
+            return None  # foto polos / gradien rata: semua hash-nya sama, tidak informatif
+        self._sync()
+        with self._lock:
+            hits = self._tree.search(value)
+        if not hits:
+            return None
+        hits.sort()
+        seqs = [seq for _, seq in hits[:50]]
+        marks = ','.join('?' * len(seqs))
+        rows = {r['seq']: r for r in get_db().execute(
+            f'SELECT seq, video_id, image_sha, thumb_url FROM used_images WHERE seq IN ({marks})', seqs)}
+        for distance, seq in hits:
+            if seq in rows:
+                return {'video_id': rows[seq]['video_id'], 'thumb_url': rows[seq]['thumb_url'],
+                        'image_sha': rows[seq]['image_sha'], 'distance': distance}
+        return None
 
-        progress_store[task_id]['message'] = 'Membaca durasi musik...'
-        progress_store[task_id]['progress'] = 10
-        duration = get_music_duration(music_path)
+    def find_url(self, url, path=None):
+        """find() untuk gambar Pinterest: hash dari image_dhash (per URL) atau dihitung dari path."""
+        value = get_image_dhash(f'url:{url}')
+        if value is None and path:
+            try:
+                value = image_dhash(path)
+                set_image_dhash(f'url:{url}', value)
+            except (OSError, ValueError) as e:
+                print(f"dhash error {url}: {e}")
+        return self.find(value)
 
-        if duration is None or duration <= 0:
-            progress_store[task_id] = {'status': 'error', 'message': 'Gagal membaca durasi musik.'}
-            return
+    def stats(self):
+        with self._lock:
+            return {'indexed': self._tree.size, 'max_distance': self.max_distance}
 
-        progress_store[task_id]['message'] = f'Durasi musik: {int(duration//60)}:{int(duration%60):02d}'
-        progress_store[task_id]['progress'] = 20
 
-        w, h = get_image_size(image_path)
-        new_w, new_h = make_1080p_size(w, h)
+duplicate_index = DuplicateIndex(DHASH_MAX_DISTANCE)
 
-        progress_store[task_id]['message'] = f'Mengatur resolusi: {new_w}x{new_h}...'
-        progress_store[task_id]['progress'] = 30
 
-        music_name = os.path.basename(music_path)
-        progress_store[task_id]['message'] = f'Membuat video dengan: {music_name}'
-        progress_store[task_id]['progress'] = 40
+# ─── THUMBNAILS ───────────────────────────────────────────
+# Poster + preview kecil tiap video dibuat dari frame hasil prepare_frame
+# (bukan decode mp4), disimpan per id video di thumbs/ dan dilayani /thumb/<id>.
+THUMB_FOLDER = os.path.join(BASE_DIR, 'thumbs')
+THUMB_SIZES = {'xs': 64, 'sm': 160, 'md': 320, 'lg': 720}  # sisi terpanjang (px)
+THUMB_DEFAULT_SIZE = 'md'
+THUMB_FORMAT, THUMB_EXT = ('WEBP', 'webp') if features.check('webp') else ('JPEG', 'jpg')
+THUMB_ID_RE = re.compile(r'^[A-Za-z0-9_-]+$')
 
-        cmd = [
-            'ffmpeg', '-y',
-            '-loop', '1',
-            '-i', image_path,
-            '-i', music_path,
-            '-vf', f'scale={new_w}:{new_h}:flags=lanczos',
-            '-c:v', 'libx264',
-            '-preset', 'medium',
-            '-crf', '18',
-            '-c:a', 'aac',
-            '-b:a', '192k',
+
+def thumb_path(video_id, size):
+    return os.path.join(THUMB_FOLDER, f'{video_id}_{size}.{THUMB_EXT}')
+
+
+def make_thumbnails(video_id, source_path):
+    """Tulis semua ukuran THUMB_SIZES untuk video_id dari gambar sumber."""
+    os.makedirs(THUMB_FOLDER, exist_ok=True)
+    with Image.open(source_path) as img:
+        img = ImageOps.exif_transpose(img).convert('RGB')
+        # dari ukuran terbesar ke terkecil, tiap langkah mengecilkan hasil sebelumnya
+        for size, edge in sorted(THUMB_SIZES.items(), key=lambda kv: -kv[1]):
+            img.thumbnail((edge, edge), Image.Resampling.LANCZOS)
+            path = thumb_path(video_id, size)
+            tmp = f'{path}.{uuid.uuid4().hex}.tmp'
+            img.save(tmp, THUMB_FORMAT, quality=80)
+            os.replace(tmp, path)
+
+
+def save_poster(video_id, frame_path):
+    """make_thumbnails yang tidak menggagalkan render; return URL /thumb atau ''."""
+    try:
+        make_thumbnails(video_id, frame_path)
+        return f'/thumb/{video_id}'
+    except Exception as e:
+        print(f"thumbnail error {video_id}: {e}")
+        return ''
+
+
+def delete_thumbnails(video_id):
+    for size in THUMB_SIZES:
+        path = thumb_path(video_id, size)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+# ─── RENDER PROFILE ───────────────────────────────────────
+# 'standard' = setting lama (25 fps, preset medium). Profil 'still*' khusus
+# foto diam: fps sangat rendah, GOP panjang, -tune stillimage, jadi encoder
+# tidak mengulang kerja untuk frame yang isinya sama.
+RENDER_PROFILES = {
+    'standard':   {'preset': 'medium',   'crf': 18, 'fps': 25, 'tune': None},
+    'still_hq':   {'preset': 'slow',     'crf': 18, 'fps': 2,  'tune': 'stillimage'},
+    'still':      {'preset': 'medium',   'crf': 20, 'fps': 1,  'tune': 'stillimage'},
+    'still_fast': {'preset': 'veryfast', 'crf': 23, 'fps': 1,  'tune': 'stillimage'},
+}
+DEFAULT_RENDER_PROFILE = os.environ.get('RENDER_PROFILE', 'standard')
+STILL_GOP_SECONDS = 10
+
+
+# ─── RENDITIONS ───────────────────────────────────────────
+# Satu job render bisa menghasilkan beberapa versi (mis. 1080p landscape +
+# Shorts 9:16) dari satu ffmpeg: frame di-decode sekali lalu di-split di
+# filter graph, tiap cabang di-scale/crop/pad ke ukurannya sendiri.
+# Rendition: nama preset di RENDITION_PRESETS, atau dict
+#   {'name', 'width', 'height' | 'short_side', 'mode': fit|crop|pad, 'bitrate': '2500k'}
+# (dict boleh pakai 'preset' sebagai dasar lalu menimpa field lain).
+# Rendition pertama = file utama (nama lama video_<id>.mp4), sisanya <nama>_<rendition>.mp4.
+RENDITION_PRESETS = {
+    '1080p':      {'short_side': 1080, 'mode': 'fit'},
+    '720p':       {'short_side': 720, 'mode': 'fit'},
+    'shorts':     {'width': 1080, 'height': 1920, 'mode': 'crop'},
+    'shorts_pad': {'width': 1080, 'height': 1920, 'mode': 'pad'},
+    'square':     {'width': 1080, 'height': 1080, 'mode': 'crop'},
+}
+DEFAULT_RENDITIONS = ['1080p']
+RENDITION_MODES = ('fit', 'crop', 'pad')
+RENDITION_MAX = 4
+RENDITION_NAME_RE = re.compile(r'^[A-Za-z0-9_-]{1,32}$')
+RENDITION_MAX_EDGE = 3840
+
+
+def parse_renditions(value):
+    """Normalisasi daftar rendition dari request/job; ValueError kalau tidak valid."""
+    if not value:
+        value = DEFAULT_RENDITIONS
+    if isinstance(value, str):
+        value = [v.strip() for v in value.split(',') if v.strip()]
+    if not isinstance(value, list) or not 1 <= len(value) <= RENDITION_MAX:
+        raise ValueError(f'renditions harus list berisi 1-{RENDITION_MAX} item')
+    result, names = [], set()
+    for item in value:
+        if isinstance(item, str):
+            item = {'preset': item}
+        if not isinstance(item, dict):
+            raise ValueError(f'rendition tidak valid: {item!r}')
+        preset = item.get('preset')
+        if preset is not None and preset not in RENDITION_PRESETS:
+            raise ValueError(f'preset rendition tidak dikenal: {preset}')
+        spec = dict(RENDITION_PRESETS.get(preset, {}))
+        spec.update((k, v) for k, v in item.items() if k != 'preset')
+        if 'width' in item or 'height' in item:
+            spec.pop('short_side', None)
+        name = str(spec.get('name') or preset or f"{spec.get('width')}x{spec.get('height')}")
+        mode = spec.get('mode', 'fit')
+        if not RENDITION_NAME_RE.match(name) or name in names:
+            raise ValueError(f'nama rendition tidak valid / dobel: {name}')
+        if mode not in RENDITION_MODES:
+            raise ValueError(f'mode rendition harus salah satu dari {RENDITION_MODES}')
+        try:
+            if spec.get('short_side'):
+                dims = {'short_side': int(spec['short_side'])}
+            else:
+                dims = {'width': int(spec['width']), 'height': int(spec['height'])}
+            bitrate = spec.get('bitrate')
+            bitrate = int(str(bitrate).lower().rstrip('k')) if bitrate else None
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f'ukuran/bitrate rendition {name} tidak valid')
+        if any(v < 16 or v > RENDITION_MAX_EDGE or v % 2 for v in dims.values()):
+            raise ValueError(f'ukuran rendition {name} harus genap, 16-{RENDITION_MAX_EDGE}')
+        if bitrate is not None and not 100 <= bitrate <= 50000:
+            raise ValueError(f'bitrate rendition {name} harus 100k-50000k')
+        names.add(name)
+        result.append(dict(dims, name=name, mode=mode, bitrate=bitrate))
+    return result
+
+
+def renditions_signature(renditions):
+    """Bagian key render cache; '' untuk rendition default supaya key lama tetap berlaku."""
+    if renditions == parse_renditions(None):
+        return ''
+    return json.dumps(renditions, sort_keys=True, separators=(',', ':'))
+
+
+def rendition_size(rendition, width, height):
+    """Ukuran output (genap) rendition untuk sumber berukuran width x height."""
+    if rendition.get('short_side'):
+        return make_short_side_size(width, height, rendition['short_side'])
+    box_w, box_h = rendition['width'], rendition['height']
+    if rendition['mode'] != 'fit':
+        return box_w, box_h
+    # fit: muat di dalam kotak dengan aspek sumber
+    scale = min(box_w / width, box_h / height)
+    return max(2, int(width * scale) // 2 * 2), max(2, int(height * scale) // 2 * 2)
+
+
+def rendition_base_size(renditions, width, height):
+    """Ukuran frame sumber (aspek asli) yang cukup besar untuk semua rendition.
+
+    Minimal make_1080p_size, supaya render satu rendition default sama
+    persis dengan sebelumnya (frame prescaled, tanpa filter).
+    """
+    base_w, base_h = make_1080p_size(width, height)
+    factor = 1.0
+    for r in renditions:
+        out_w, out_h = rendition_size(r, base_w, base_h)
+        ratios = (out_w / base_w, out_h / base_h)
+        factor = max(factor, max(ratios) if r['mode'] == 'crop' else min(ratios))
+    if factor <= 1.0:
+        return base_w, base_h
+    short = min(base_w, base_h) * factor
+    return make_short_side_size(base_w, base_h, min(RENDITION_MAX_EDGE, int(math.ceil(short / 2) * 2)))
+
+
+def rendition_filter(rendition, out_size, base_size):
+    """Filter ffmpeg frame base_size -> out_size sesuai mode, None kalau sudah pas."""
+    if out_size == tuple(base_size):
+        return None
+    w, h = out_size
+    if rendition['mode'] == 'crop':
+        chain = f'scale={w}:{h}:force_original_aspect_ratio=increase:flags=lanczos,crop={w}:{h}'
+    elif rendition['mode'] == 'pad':
+        chain = (f'scale={w}:{h}:force_original_aspect_ratio=decrease:force_divisible_by=2:flags=lanczos,'
+                 f'pad={w}:{h}:(ow-iw)/2:(oh-ih)/2:black')
+    else:
+        chain = f'scale={w}:{h}:flags=lanczos'
+    return chain + ',setsar=1'
+
+
+def rendition_graph(filters, source='[0:v]'):
+    """filter_complex untuk decode sekali -> N output. Return (graph atau None, label map per output).
+
+    source: label video sumber (input pertama, atau ujung filter graph lain).
+    """
+    if len(filters) == 1 and not filters[0]:
+        return None, ['0:v:0' if source == '[0:v]' else source]
+    if len(filters) == 1:
+        return f'{source}{filters[0]}[o0]', ['[o0]']
+    parts = ['{}split={}{}'.format(source, len(filters), ''.join(f'[s{i}]' for i in range(len(filters))))]
+    parts += [f'[s{i}]{f or "null"}[o{i}]' for i, f in enumerate(filters)]
+    return ';'.join(parts), [f'[o{i}]' for i in range(len(filters))]
+
+
+def rendition_outputs(renditions, output_path, base_size):
+    """Rencana output per rendition: dict name/path/size/mode/bitrate/filter."""
+    stem, ext = os.path.splitext(output_path)
+    outputs = []
+    for i, r in enumerate(renditions):
+        size = rendition_size(r, *base_size)
+        outputs.append({
+            'name': r['name'],
+            'path': output_path if i == 0 else f"{stem}_{r['name']}{ext}",
+            'size': size,
+            'mode': r['mode'],
+            'bitrate': r['bitrate'],
+            'filter': rendition_filter(r, size, base_size),
+        })
+    return outputs
+
+
+def x264_args(profile, preset=None, threads=None, bitrate=None):
+    """Opsi libx264 per output: CRF profil, atau bitrate target (kbps) kalau rendition memintanya."""
+    p = RENDER_PROFILES[profile]
+    args = ['-c:v', 'libx264', '-preset', preset or p['preset']]
+    if bitrate:
+        args += ['-b:v', f'{bitrate}k', '-maxrate', f'{bitrate}k', '-bufsize', f'{bitrate * 2}k']
+    else:
+        args += ['-crf', str(p['crf'])]
+    if threads:
+        args += ['-threads', str(threads)]
+    return args
+
+
+def build_render_cmd(image_path, music_path, output_path, size, duration, profile,
+                     audio_copy=False, prescaled=False, preset=None, threads=None):
+    """Susun command ffmpeg foto + musik -> mp4 sesuai profil render.
+
+    audio_copy=True kalau music_path sudah AAC dari audio cache,
+    prescaled=True kalau image_path sudah berukuran `size` (dari prepare_frame).
+    preset/threads menimpa nilai profil (dari encoder_tuner.plan).
+    output_path boleh juga list (path, filter, bitrate) per rendition:
+    semua ditulis dari satu decode lewat rendition_graph.
+    """
+    p = RENDER_PROFILES[profile]
+    new_w, new_h = size
+    outputs = [(output_path, None, None)] if isinstance(output_path, str) else output_path
+    graph, labels = rendition_graph([f for _, f, _ in outputs])
+    cmd = ['ffmpeg', '-y']
+    if p['tune'] == 'stillimage':
+        cmd += ['-framerate', str(p['fps'])]
+    cmd += [
+        '-loop', '1',
+        '-i', image_path,
+        '-i', music_path,
+    ]
+    if graph:
+        cmd += ['-filter_complex', graph]
+    elif not prescaled:
+        cmd += ['-vf', f'scale={new_w}:{new_h}:flags=lanczos']
+    for (path, _, bitrate), label in zip(outputs, labels):
+        if graph:
+            cmd += ['-map', label, '-map', '1:a:0']
+        cmd += x264_args(profile, preset, threads, bitrate)
+        if p['tune']:
+            cmd += ['-tune', p['tune'], '-r', str(p['fps']), '-g', str(p['fps'] * STILL_GOP_SECONDS)]
+        if audio_copy:
+            if not graph:
+                cmd += ['-map', '0:v:0', '-map', '1:a:0']
+            cmd += ['-c:a', 'copy']
+        else:
+            cmd += ['-c:a', 'aac', '-b:a', AUDIO_BITRATE]
+        cmd += [
             '-t', str(duration),
             '-shortest',
             '-pix_fmt', 'yuv420p',
             '-movflags', '+faststart',
+            path
+        ]
+    return cmd
+
+
+# ─── LOOP ENGINE ──────────────────────────────────────────
+# Foto diam cukup di-encode sekali sebagai segmen pendek (satu GOP tertutup,
+# tanpa B-frame) yang di-cache per frame + profil + preset; video penuh dibuat
+# dengan -stream_loop + stream copy dan dipotong tepat di durasi audio (durasi
+# paket video terakhir dipendekkan lewat bsf setts, lalu dicek dengan ffprobe).
+# Kerja encode video jadi konstan, tidak bertambah dengan panjang lagu.
+# Default masih encode penuh per job; RENDER_ENGINE=loop untuk engine ini.
+RENDER_ENGINE = os.environ.get('RENDER_ENGINE', 'encode')
+LOOP_SEGMENT_SECONDS = 10
+LOOP_DURATION_TOLERANCE = 0.05  # detik, selisih maksimal durasi video hasil loop vs audio
+SEGMENT_CACHE_FOLDER = os.path.join(BASE_DIR, 'cache', 'segments')
+SEGMENT_CACHE_MAX_MB = int(os.environ.get('SEGMENT_CACHE_MAX_MB', 200))
+_segment_lock = threading.Lock()
+
+
+def segment_path(frame_path, profile, preset, size, mode='fit', bitrate=None):
+    name = os.path.splitext(os.path.basename(frame_path))[0]
+    quality = f'{bitrate}k' if bitrate else 'crf'
+    return os.path.join(SEGMENT_CACHE_FOLDER, f'{name}_{size[0]}x{size[1]}_{mode}_{profile}_{preset}_'
+                                              f'{quality}_{LOOP_SEGMENT_SECONDS}s.mp4')
+
+
+def build_segment_cmd(frame_path, outputs, profile, preset=None, threads=None):
+    """Encode LOOP_SEGMENT_SECONDS detik frame (sudah prescaled) jadi satu GOP tertutup.
+
+    outputs: list (path, filter, bitrate), satu segmen per rendition dari satu decode.
+    """
+    p = RENDER_PROFILES[profile]
+    frames = p['fps'] * LOOP_SEGMENT_SECONDS
+    graph, labels = rendition_graph([f for _, f, _ in outputs])
+    cmd = [
+        'ffmpeg', '-y',
+        '-framerate', str(p['fps']),
+        '-loop', '1',
+        '-i', frame_path,
+    ]
+    if graph:
+        cmd += ['-filter_complex', graph]
+    for (path, _, bitrate), label in zip(outputs, labels):
+        if graph:
+            cmd += ['-map', label]
+        cmd += ['-frames:v', str(frames)] + x264_args(profile, preset, threads, bitrate)
+        if p['tune']:
+            cmd += ['-tune', p['tune']]
+        cmd += [
+            # keyframe cuma di awal segmen -> tiap pengulangan mulai dari IDR
+            '-r', str(p['fps']), '-g', str(frames), '-keyint_min', str(frames),
+            '-sc_threshold', '0', '-bf', '0',
+            '-pix_fmt', 'yuv420p',
+            '-an', '-f', 'mp4',
+            path
+        ]
+    return cmd
+
+
+def stream_durations(path):
+    """Durasi per jenis stream ({'video': detik, 'audio': detik}) dari ffprobe; {} kalau gagal."""
+    try:
+        result = subprocess.run([
+            'ffprobe', '-v', 'error',
+            '-show_entries', 'stream=codec_type,duration',
+            '-of', 'json',
+            path
+        ], capture_output=True, text=True, timeout=30)
+        streams = json.loads(result.stdout).get('streams') or []
+        return {st['codec_type']: float(st['duration']) for st in streams if st.get('duration')}
+    except Exception as e:
+        print(f"ffprobe error: {e}")
+        return {}
+
+
+def build_loop_cmd(segments, music_path, outputs, duration, audio_copy=False):
+    """Ulang tiap segmen (stream copy) + audio, potong di `duration`; satu output per segmen.
+
+    -t saja memotong di batas paket (di profil 1 fps video bisa lebih panjang
+    sampai 1 detik), jadi durasi paket terakhir dipotong ke `duration` dengan setts.
+    """
+    cmd = ['ffmpeg', '-y']
+    for segment in segments:
+        cmd += ['-stream_loop', '-1', '-i', segment]
+    cmd += ['-i', music_path]
+    audio = len(segments)
+    for i, output_path in enumerate(outputs):
+        cmd += [
+            '-map', f'{i}:v:0', '-map', f'{audio}:a:0',
+            '-c:v', 'copy',
+            '-bsf:v', f"setts=duration='min(DURATION,{duration}/TB-PTS)'",
+        ]
+        if audio_copy:
+            cmd += ['-c:a', 'copy']
+        else:
+            cmd += ['-c:a', 'aac', '-b:a', AUDIO_BITRATE]
+        cmd += [
+            '-t', str(duration),
+            '-movflags', '+faststart',
             output_path
         ]
+    return cmd
+
+
+# ─── ENCODER AUTOTUNE ─────────────────────────────────────
+# Preset x264, -threads dan jumlah render barengan dipilih per job dari jumlah
+# core, panjang antrian dan target latency. Kecepatan tiap preset di mesin ini
+# diukur sekali (micro-benchmark beberapa detik saat worker render pertama
+# start) dan disimpan di tabel meta per sidik mesin (core, arsitektur, ffmpeg).
+AUTOTUNE = os.environ.get('AUTOTUNE', '1') == '1'
+RENDER_TARGET_LATENCY = float(os.environ.get('RENDER_TARGET_LATENCY', 300))  # detik sampai job baru selesai
+AUTOTUNE_PRESETS = ['veryfast', 'faster', 'fast', 'medium', 'slow']  # cepat -> bagus
+AUTOTUNE_CALIBRATION_FRAMES = 15
+AUTOTUNE_CALIBRATION_SIZE = (1440, 1080)
+AUTOTUNE_CALIBRATION_TIMEOUT = 120
+AUTOTUNE_KEEP_DECISIONS = 50
+
+
+class EncoderTuner:
+    def __init__(self):
+        self.calibration = None
+        self.ready = threading.Event()
+        self.decisions = collections.deque(maxlen=AUTOTUNE_KEEP_DECISIONS)
+        self._lock = threading.Lock()
+        self._started = False
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        if not AUTOTUNE:
+            self.ready.set()
+            return
+        threading.Thread(target=self._load_or_calibrate, name='encoder-calibrate', daemon=True).start()
+
+    def _fingerprint(self):
+        try:
+            ffmpeg = subprocess.run(['ffmpeg', '-version'], capture_output=True, text=True).stdout.splitlines()[0]
+        except (OSError, IndexError):
+            ffmpeg = ''
+        return f'{os.cpu_count()}|{platform.machine()}|{ffmpeg}'
+
+    def _load_or_calibrate(self):
+        try:
+            fingerprint = self._fingerprint()
+            row = get_db().execute("SELECT value FROM meta WHERE key = 'encoder_calibration'").fetchone()
+            cached = json.loads(row['value']) if row else None
+            if cached and cached.get('fingerprint') == fingerprint:
+                self.calibration = cached
+                return
+            calibration = self.calibrate()
+            calibration['fingerprint'] = fingerprint
+            conn = get_db()
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('encoder_calibration', ?)",
+                             (json.dumps(calibration),))
+            self.calibration = calibration
+        except Exception as e:
+            print(f"encoder calibration error: {e}")
+        finally:
+            self.ready.set()
+
+    def calibrate(self):
+        """Ukur piksel/detik tiap preset (semua core) untuk foto diam 1440x1080.
+
+        Dua kali encode (N dan 3N frame) lalu pakai selisihnya, supaya waktu
+        start ffmpeg/x264 tidak ikut terhitung sebagai biaya per frame.
+        """
+        w, h = AUTOTUNE_CALIBRATION_SIZE
+        n = AUTOTUNE_CALIBRATION_FRAMES
+        pixel_rate = {}
+        with tempfile.TemporaryDirectory() as tmp:
+            still = os.path.join(tmp, 'still.png')
+            Image.effect_mandelbrot((w, h), (-2, -1.2, 1, 1.2), 60).convert('RGB').save(still)
+
+            def encode_seconds(preset, frames):
+                start = time.time()
+                result = subprocess.run([
+                    'ffmpeg', '-v', 'error', '-loop', '1', '-framerate', '25', '-i', still,
+                    '-frames:v', str(frames),
+                    '-c:v', 'libx264', '-preset', preset, '-crf', '20', '-pix_fmt', 'yuv420p',
+                    '-f', 'null', '-'
+                ], capture_output=True, text=True)
+                if result.returncode != 0:
+                    raise RuntimeError(result.stderr[-300:])
+                return time.time() - start
+
+            for preset in AUTOTUNE_PRESETS:
+                marginal = encode_seconds(preset, 3 * n) - encode_seconds(preset, n)
+                pixel_rate[preset] = 2 * n * w * h / max(marginal, 1e-3)
+        return {'cores': os.cpu_count() or 1, 'pixel_rate': pixel_rate,
+                'measured_at': time.strftime('%Y-%m-%d %H:%M:%S')}
+
+    def concurrency(self, queued):
+        """Berapa render boleh jalan barengan di mesin ini (semua proses, dicek di _claim).
+
+        Antrian pendek: satu job dengan semua core (latency job itu minimal);
+        antrian panjang: lebih banyak job dengan thread lebih sedikit
+        (x264 tidak skala linear, jadi throughput total naik).
+        """
+        return max(1, min(RENDER_WORKERS, 1 + queued // 2))
+
+    def estimate(self, preset, threads, size, frames):
+        """Perkiraan detik encode, None kalau belum ada kalibrasi."""
+        cal = self.calibration
+        if not cal or preset not in cal['pixel_rate']:
+            return None
+        rate = cal['pixel_rate'][preset] * threads / cal['cores']
+        return frames * size[0] * size[1] / rate
+
+    def plan(self, task_id, profile, size, duration):
+        """Pilih preset + threads untuk job ini. Return dict (juga disimpan di decisions)."""
+        p = RENDER_PROFILES[profile]
+        cores = os.cpu_count() or 1
+        # core dibagi ke semua render yang jalan, bukan hanya thread proses ini
+        active = max(1, render_queue.active, render_queue.running())
+        queued = render_queue.stats()['queue_depth']
+        threads = max(1, cores // active)
+        preset = p['preset']
+        estimate = None
+        # antrian di depan job berikutnya: berapa "putaran" render lagi sampai giliran
+        rounds = math.ceil((queued + 1) / self.concurrency(queued))
+        if AUTOTUNE and preset in AUTOTUNE_PRESETS and self.calibration:
+            frames = duration * p['fps']
+            # preset terbaik (maks = preset profil) yang masih memenuhi target latency
+            allowed = AUTOTUNE_PRESETS[:AUTOTUNE_PRESETS.index(preset) + 1]
+            preset = allowed[0]
+            for candidate in reversed(allowed):
+                est = self.estimate(candidate, threads, size, frames)
+                if est is not None and est * rounds <= RENDER_TARGET_LATENCY:
+                    preset = candidate
+                    break
+            estimate = self.estimate(preset, threads, size, frames)
+        decision = {
+            'task_id': task_id,
+            'profile': profile,
+            'preset': preset,
+            'threads': threads if AUTOTUNE else None,
+            'active': active,
+            'queued': queued,
+            'estimated_seconds': round(estimate, 1) if estimate is not None else None,
+            'at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        self.decisions.appendleft(decision)
+        return decision
+
+
+encoder_tuner = EncoderTuner()
+
 
-        progress_store[task_id]['progress'] = 50
-        progress_store[task_id]['message'] = 'Encoding video...'
+FFMPEG_STDERR_LINES = 50
 
-        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
 
-        start_time = time.time()
-        estimated_duration = max(duration * 0.5, 5)
+def run_ffmpeg(cmd, task_id, duration, base=50, span=45, stage='ffmpeg_encode'):
+    """Jalankan ffmpeg dan update progress_store dari output -progress.
 
-        while proc.poll() is None:
-            elapsed = time.time() - start_time
-            enc_progress = min(45, int((elapsed / estimated_duration) * 45))
-            progress_store[task_id]['progress'] = 50 + enc_progress
-            time.sleep(0.5)
+    Progress encode dipetakan ke rentang base..base+span. stderr dibaca
+    terus di thread terpisah (disimpan N baris terakhir) supaya pipe tidak
+    penuh dan ffmpeg tidak macet di encode yang panjang.
+    Return (returncode, stderr_tail).
+    """
+    cmd = [cmd[0], '-progress', 'pipe:1', '-nostats'] + cmd[1:]
+    start = time.time()
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            text=True, bufsize=1)
+    stderr_tail = collections.deque(maxlen=FFMPEG_STDERR_LINES)
 
-        proc.wait()
+    def drain_stderr():
+        for line in proc.stderr:
+            stderr_tail.append(line)
 
-        if proc.returncode != 0:
-            stderr = proc.stderr.read() if proc.stderr else ''
-            progress_store[task_id] = {
+    drainer = threading.Thread(target=drain_stderr, daemon=True)
+    drainer.start()
+
+    stats = {}
+    for line in proc.stdout:
+        key, _, value = line.strip().partition('=')
+        stats[key] = value
+        if key != 'progress':
+            continue
+        try:
+            out_time = int(stats.get('out_time_us') or stats.get('out_time_ms') or 0) / 1_000_000
+        except ValueError:
+            out_time = 0
+        try:
+            speed = float(stats.get('speed', '').rstrip('x'))
+        except ValueError:
+            speed = 0.0
+        try:
+            fps = float(stats.get('fps') or 0)
+        except ValueError:
+            fps = 0.0
+        pct = max(0.0, min(1.0, out_time / duration)) if duration else 0.0
+        eta = (duration - out_time) / speed if speed > 0 else None
+        msg = f'Encoding {pct * 100:.0f}%'
+        if speed > 0:
+            msg += f' · {speed:.1f}x'
+        if eta is not None:
+            msg += f' · sisa {int(max(0, eta))} dtk'
+        progress_store.update(
+            task_id,
+            message=msg,
+            progress=base + int(pct * span),
+            encode_percent=round(pct * 100, 1),
+            encode_speed=speed,
+            encode_fps=fps,
+            eta=round(max(0.0, eta), 1) if eta is not None else None,
+        )
+
+    proc.wait()
+    drainer.join(timeout=5)
+    seconds = time.time() - start
+    output_path = cmd[-1]
+    if proc.returncode != 0:
+        record_failure(stage, 'ffmpeg_exit', task_id=task_id, returncode=proc.returncode,
+                       seconds=round(seconds, 3))
+    else:
+        output_bytes = os.path.getsize(output_path) if os.path.exists(output_path) else 0
+        metrics.observe('mvfi_stage_seconds', seconds, stage=stage)
+        metrics.inc('mvfi_bytes_total', output_bytes, stage=stage, direction='out')
+        if duration and seconds > 0 and stage == 'ffmpeg_encode':
+            metrics.observe('mvfi_encode_speed_ratio', duration / seconds)
+        log_event('stage', stage=stage, task_id=task_id, seconds=round(seconds, 3),
+                  duration=duration, speed=round(duration / seconds, 2) if duration and seconds > 0 else None,
+                  bytes=output_bytes)
+    return proc.returncode, ''.join(stderr_tail)
+
+
+def render_video(task_id, frame_path, music_path, outputs, size, duration, profile):
+    """Render frame (hasil prepare_frame, berukuran `size`) + musik ke semua rendition_outputs.
+
+    Engine 'loop': segmen per rendition dari cache (yang belum ada di-encode
+    bareng dalam satu ffmpeg) lalu loop + stream copy; kalau gagal jatuh ke
+    encode penuh. Return (returncode, stderr, encoder) dengan encoder = dict
+    preset/threads/engine.
+    """
+    cached_audio = audio_cache.get(music_path)
+    audio = cached_audio or music_path
+    if RENDER_ENGINE == 'loop':
+        plan = encoder_tuner.plan(task_id, profile, size, min(duration, LOOP_SEGMENT_SECONDS))
+        segments = [segment_path(frame_path, profile, plan['preset'], o['size'], o['mode'], o['bitrate'])
+                    for o in outputs]
+        missing = []
+        for o, segment in zip(outputs, segments):
+            if os.path.exists(segment):
+                os.utime(segment)
+            elif segment not in (m[0] for m in missing):
+                missing.append((segment, f'{segment}.{uuid.uuid4().hex}.tmp', o))
+        returncode, stderr = 0, ''
+        if missing:
+            os.makedirs(SEGMENT_CACHE_FOLDER, exist_ok=True)
+            cmd = build_segment_cmd(frame_path, [(tmp, o['filter'], o['bitrate']) for _, tmp, o in missing],
+                                    profile, plan['preset'], plan['threads'])
+            returncode, stderr = run_ffmpeg(cmd, task_id, LOOP_SEGMENT_SECONDS, base=50, span=20)
+            for segment, tmp, _ in missing:
+                if returncode == 0:
+                    os.replace(tmp, segment)
+                elif os.path.exists(tmp):
+                    os.remove(tmp)
+            if returncode == 0:
+                with _segment_lock:
+                    prune_cache_folder(SEGMENT_CACHE_FOLDER, SEGMENT_CACHE_MAX_MB * 1024 * 1024, '*.mp4')
+        if returncode == 0:
+            cmd = build_loop_cmd(segments, audio, [o['path'] for o in outputs], duration,
+                                 audio_copy=bool(cached_audio))
+            returncode, stderr = run_ffmpeg(cmd, task_id, duration, base=70, span=25, stage='ffmpeg_mux')
+        if returncode == 0:
+            # hasil loop harus sama panjang dengan audio; kalau tidak, encode penuh
+            for o in outputs:
+                video = stream_durations(o['path']).get('video')
+                if video is None or abs(video - duration) > LOOP_DURATION_TOLERANCE:
+                    record_failure('ffmpeg_mux', 'duration_mismatch', task_id=task_id,
+                                   expected=duration, video=video)
+                    returncode, stderr = 1, f'durasi video {video} != audio {duration}'
+                    break
+        if returncode == 0:
+            return returncode, stderr, {'preset': plan['preset'], 'threads': plan['threads'], 'engine': 'loop'}
+        print(f"loop engine gagal ({task_id}), encode penuh: {stderr[-300:]}")
+    encoder = encoder_tuner.plan(task_id, profile, size, duration)
+    cmd = build_render_cmd(frame_path, audio, [(o['path'], o['filter'], o['bitrate']) for o in outputs],
+                           size, duration, profile, audio_copy=bool(cached_audio), prescaled=True,
+                           preset=encoder['preset'], threads=encoder['threads'])
+    returncode, stderr = run_ffmpeg(cmd, task_id, duration)
+    return returncode, stderr, {'preset': encoder['preset'], 'threads': encoder['threads'], 'engine': 'encode'}
+
+
+def rendition_summary(outputs):
+    return [{'name': o['name'], 'filename': os.path.basename(o['path']),
+             'resolution': f"{o['size'][0]}x{o['size'][1]}", 'mode': o['mode'], 'bitrate': o['bitrate']}
+            for o in outputs]
+
+
+def rendition_log_entries(base_entry, outputs):
+    """Satu entry log per rendition, semua dengan id job yang sama."""
+    summary = rendition_summary(outputs)
+    entries = []
+    for item in summary:
+        entry = dict(base_entry, filename=item['filename'], resolution=item['resolution'],
+                     rendition=item['name'], renditions=summary)
+        if entry.get('title') == summary[0]['filename']:
+            entry['title'] = item['filename']
+        entries.append(entry)
+    return entries
+
+
+def create_video_task(task_id, image_path, music_path, output_path, profile=None, renditions=None):
+    profile = profile or DEFAULT_RENDER_PROFILE
+    try:
+        renditions = parse_renditions(renditions)
+        progress_store.set(task_id, {'status': 'processing', 'progress': 0, 'message': 'Memulai proses...'})
+
+        progress_store.update(task_id, message='Membaca durasi musik...', progress=10)
+        duration = music_index.duration(music_path)
+
+        if duration is None or duration <= 0:
+            progress_store.set(task_id, {'status': 'error', 'message': 'Gagal membaca durasi musik.'})
+            return
+
+        progress_store.update(task_id, message=f'Durasi musik: {int(duration//60)}:{int(duration%60):02d}', progress=20)
+
+        frame_path, base_size = prepare_frame(image_path, lambda w, h: rendition_base_size(renditions, w, h))
+        poster = save_poster(task_id, frame_path)
+        outputs = rendition_outputs(renditions, output_path, base_size)
+        new_w, new_h = outputs[0]['size']
+
+        progress_store.update(task_id, message=f'Mengatur resolusi: {new_w}x{new_h}...', progress=30)
+
+        music_name = os.path.basename(music_path)
+        progress_store.update(task_id, message=f'Membuat video dengan: {music_name}', progress=40)
+
+        progress_store.update(task_id, progress=50, message='Encoding video...')
+
+        returncode, stderr, encoder = render_video(task_id, frame_path, music_path, outputs,
+                                                   base_size, duration, profile)
+
+        if returncode != 0:
+            progress_store.set(task_id, {
                 'status': 'error',
                 'message': f'FFmpeg error: {stderr[-300:] if stderr else "unknown"}'
-            }
+            })
             return
 
-        if not os.path.exists(output_path) or os.path.getsize(output_path) == 0:
-            progress_store[task_id] = {'status': 'error', 'message': 'File video tidak terbuat.'}
+        if any(not os.path.exists(o['path']) or os.path.getsize(o['path']) == 0 for o in outputs):
+            progress_store.set(task_id, {'status': 'error', 'message': 'File video tidak terbuat.'})
             return
 
         output_filename = os.path.basename(output_path)
-        progress_store[task_id] = {
+        progress_store.set(task_id, {
             'status': 'done',
             'progress': 100,
             'message': 'Video berhasil dibuat!',
             'output_filename': output_filename,
             'music_name': music_name,
             'resolution': f'{new_w}x{new_h}',
-            'duration': int(duration)
-        }
+            'duration': int(duration),
+            'profile': profile,
+            'renditions': rendition_summary(outputs),
+        })
 
         # Simpan ke maker_log
         log_entry = {
@@ -169,13 +2486,16 @@ def create_video_task(task_id, image_path, music_path, output_path):
             'music': music_name,
             'resolution': f'{new_w}x{new_h}',
             'duration': int(duration),
+            'profile': profile,
+            'image': os.path.basename(image_path),
+            'poster': poster,
+            'encoder': encoder,
             'created_at': time.strftime('%Y-%m-%d %H:%M:%S')
         }
-        ml = load_maker_log()
-        ml.insert(0, log_entry)
-        save_maker_log(ml)
+        for entry in rendition_log_entries(log_entry, outputs):
+            add_maker_log(entry)
 
-        # Simpan juga ke hasil_video/log.json supaya bisa di-send ke web 1
+        # Simpan juga ke log hasil_video supaya bisa di-send ke web 1
         hasil_log_entry = {
             'id': task_id,
             'title': output_filename,
@@ -184,23 +2504,157 @@ def create_video_task(task_id, image_path, music_path, output_path):
             'music': music_name,
             'resolution': f'{new_w}x{new_h}',
             'duration': int(duration),
+            'profile': profile,
+            'image': os.path.basename(image_path),
+            'poster': poster,
+            'encoder': encoder,
             'created_at': time.strftime('%Y-%m-%d %H:%M:%S'),
             'source': 'maker'
         }
-        hasil_log_path = os.path.join(HASIL_VIDEO_FOLDER, 'log.json')
-        hasil_log = []
-        if os.path.exists(hasil_log_path):
-            try:
-                with open(hasil_log_path) as f:
-                    hasil_log = json.load(f)
-            except:
-                hasil_log = []
-        hasil_log.insert(0, hasil_log_entry)
-        with open(hasil_log_path, 'w') as f:
-            json.dump(hasil_log, f, indent=2)
+        for entry in rendition_log_entries(hasil_log_entry, outputs):
+            add_video_log(entry)
+        duplicate_index.add(task_id, image_path)
 
     except Exception as e:
-        progress_store[task_id] = {'status': 'error', 'message': str(e)}
+        progress_store.set(task_id, {'status': 'error', 'message': str(e)})
+
+
+# ─── CONTENT STORE & RENDER CACHE ─────────────────────────
+# Upload (dan gambar Pinterest) disimpan dengan nama = sha256 isinya, jadi foto
+# yang sama tidak tersimpan dua kali. Hasil render dicatat per
+# (hash gambar, hash musik, profil): request ulang yang identik langsung dapat
+# video yang sudah ada (atau ikut job yang masih jalan) tanpa encode lagi.
+RENDER_OUTPUT_PREFIX = {'pin': 'pinvid', 'slideshow': 'slideshow'}
+
+
+def save_content_addressed(stream, ext):
+    """Tulis stream ke UPLOAD_FOLDER sambil di-hash. Return (filename, sha, sudah_ada)."""
+    h = hashlib.sha256()
+    tmp = os.path.join(UPLOAD_FOLDER, f'.{uuid.uuid4().hex}.tmp')
+    try:
+        with open(tmp, 'wb') as f:
+            for chunk in iter(lambda: stream.read(1024 * 1024), b''):
+                h.update(chunk)
+                f.write(chunk)
+        sha = h.hexdigest()
+        filename = f'{sha[:32]}{ext}'
+        path = os.path.join(UPLOAD_FOLDER, filename)
+        existed = os.path.exists(path)
+        if not existed:
+            os.replace(tmp, path)
+        return filename, sha, existed
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def render_cache_key(image_path, music_path, profile, renditions=None, variant=''):
+    """image_path boleh list (slideshow); variant = opsi lain yang mengubah hasil."""
+    music_sha = music_index.content_hash(music_path) or file_sha256(music_path)
+    if isinstance(image_path, str):
+        image_sha = file_sha256(image_path)
+    else:
+        image_sha = hashlib.sha256(':'.join(file_sha256(p) for p in image_path).encode()).hexdigest()
+    key = f'{image_sha}:{music_sha}:{profile}'
+    signature = (renditions_signature(renditions) if renditions else '') + variant
+    return f'{key}:{hashlib.sha256(signature.encode()).hexdigest()[:16]}' if signature else key
+
+
+def reuse_render(key, kind):
+    """task_id render lama dengan key yang sama (selesai / masih di antrian), atau None."""
+    cached = get_render_cache(key)
+    if not cached:
+        return None
+    task_id = cached['task_id']
+    job = render_queue.get(task_id)
+    if job and job['status'] in ('queued', 'running'):
+        return task_id
+    entry = get_video_entry(cached['filename'])
+    filenames = [r['filename'] for r in (entry or {}).get('renditions') or [{'filename': cached['filename']}]]
+    if not entry or not all(os.path.exists(os.path.join(HASIL_VIDEO_FOLDER, f)) for f in filenames):
+        delete_render_cache(cached['filename'])
+        return None
+    progress_store.set(task_id, {
+        'status': 'done',
+        'progress': 100,
+        'message': 'Video sudah pernah dibuat (dari cache)',
+        'type': kind,
+        'output_filename': cached['filename'],
+        'music_name': entry.get('music', ''),
+        'resolution': entry.get('resolution', ''),
+        'duration': entry.get('duration', 0),
+        'profile': entry.get('profile', ''),
+        'title': entry.get('title', ''),
+        'renditions': entry.get('renditions', []),
+        'cached': True,
+    })
+    return task_id
+
+
+def submit_render(kind, image_path, music_path, profile, make_args, priority=5, renditions=None, variant=''):
+    """Antrikan render kecuali kombinasi gambar+musik+profil(+rendition) sudah pernah dirender.
+
+    make_args(task_id, output_path) -> tuple argumen untuk RENDER_TASKS[kind].
+    """
+    key = render_cache_key(image_path, music_path, profile, renditions, variant)
+    while True:
+        task_id = reuse_render(key, kind)
+        if task_id:
+            return task_id
+        task_id = str(uuid.uuid4())
+        prefix = RENDER_OUTPUT_PREFIX.get(kind, 'video')
+        output_filename = f"{prefix}_{task_id}.mp4"
+        output_path = os.path.join(HASIL_VIDEO_FOLDER, output_filename)
+        # cek + insert render_cache + job dalam satu transaksi (aman antar proses);
+        # None = request identik lain baru saja masuk, ulangi supaya ikut job itu
+        if render_queue.submit(kind, task_id, make_args(task_id, output_path), priority=priority,
+                               render_cache=(key, output_filename)):
+            return task_id
+
+
+# ─── MEDIA SERVING ────────────────────────────────────────
+# Video/foto/musik dikirim dengan Range (206), ETag + Last-Modified (304) dari
+# send_file. Nama file hasil render dan upload tidak pernah dipakai ulang untuk
+# isi lain (uuid / hash isi), jadi boleh di-cache browser selamanya.
+#
+# MEDIA_OFFLOAD supaya file besar tidak menahan worker Python:
+#   x-sendfile -> header X-Sendfile (Apache mod_xsendfile, lighttpd)
+#   x-accel    -> header X-Accel-Redirect ke MEDIA_ACCEL_PREFIX, contoh nginx:
+#       location /_media/ { internal; alias /path/ke/mvfi/; }
+#     file di luar BASE_DIR (mis. MUSIC_FOLDER di tempat lain) tidak punya
+#     location internal, jadi tetap dikirim lewat send_file.
+MEDIA_OFFLOAD = os.environ.get('MEDIA_OFFLOAD', '').lower()
+MEDIA_ACCEL_PREFIX = os.environ.get('MEDIA_ACCEL_PREFIX', '/_media').rstrip('/')
+MEDIA_IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+MEDIA_MAX_AGE = 3600  # musik bisa diganti di tempat, jadi pendek + revalidasi ETag
+app.config['USE_X_SENDFILE'] = MEDIA_OFFLOAD == 'x-sendfile'
+
+
+def find_media(folders, filename):
+    """Path file pertama yang ada di salah satu folder (aman dari ../), atau None."""
+    for folder in folders:
+        path = safe_join(folder, filename)
+        if path and os.path.isfile(path):
+            return path
+    return None
+
+
+def send_media(path, immutable=False, as_attachment=False):
+    filename = os.path.basename(path)
+    max_age = MEDIA_IMMUTABLE_MAX_AGE if immutable else MEDIA_MAX_AGE
+    rel = os.path.relpath(os.path.realpath(path), os.path.realpath(BASE_DIR))
+    if MEDIA_OFFLOAD == 'x-accel' and rel != os.pardir and not rel.startswith(os.pardir + os.sep):
+        rel = rel.replace(os.sep, '/')
+        resp = Response(status=200, mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+        resp.headers['X-Accel-Redirect'] = urllib.parse.quote(f'{MEDIA_ACCEL_PREFIX}/{rel}')
+        if as_attachment:
+            resp.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    else:
+        resp = send_file(path, as_attachment=as_attachment, download_name=filename,
+                         conditional=True, max_age=max_age)
+    resp.headers['Accept-Ranges'] = 'bytes'
+    resp.headers['Cache-Control'] = f'public, max-age={max_age}' + (', immutable' if immutable else '')
+    return resp
 
 
 @app.route('/')
@@ -218,57 +2672,68 @@ def upload():
     ext = os.path.splitext(file.filename)[1].lower()
     if ext not in ['.jpg', '.jpeg', '.png', '.webp', '.bmp']:
         return jsonify({'error': 'Format tidak didukung'}), 400
-    filename = f"{uuid.uuid4()}{ext}"
-    save_path = os.path.join(UPLOAD_FOLDER, filename)
-    file.save(save_path)
-    w, h = get_image_size(save_path)
-    return jsonify({'filename': filename, 'width': w, 'height': h})
+    filename, _, existed = save_content_addressed(file.stream, ext)
+    w, h = get_image_size(os.path.join(UPLOAD_FOLDER, filename))
+    return jsonify({'filename': filename, 'width': w, 'height': h, 'duplicate': existed})
 
 
 @app.route('/uploads/<filename>')
 def serve_upload(filename):
-    return send_from_directory(UPLOAD_FOLDER, filename)
+    path = find_media([UPLOAD_FOLDER], filename)
+    if not path:
+        abort(404)
+    return send_media(path, immutable=True)
 
 
 @app.route("/outputs/<filename>")
 def serve_output(filename):
     # Cari di hasil_video dulu, fallback ke outputs
-    path = os.path.join(HASIL_VIDEO_FOLDER, filename)
-    if os.path.exists(path):
-        return send_from_directory(HASIL_VIDEO_FOLDER, filename)
-    return send_from_directory(OUTPUT_FOLDER, filename)
+    path = find_media([HASIL_VIDEO_FOLDER, OUTPUT_FOLDER], filename)
+    if not path:
+        abort(404)
+    return send_media(path, immutable=True)
 
 
 @app.route('/music-list')
 def music_list():
     """Return list of all music files."""
     music_folder = get_music_folder()
-    music_files = []
-    for ext in MUSIC_EXTENSIONS:
-        music_files.extend(glob.glob(os.path.join(music_folder, f'*{ext}')))
-        music_files.extend(glob.glob(os.path.join(music_folder, f'*{ext.upper()}')))
-
-    music_files = sorted(set(music_files))
-
     result = []
-    for f in music_files:
-        name = os.path.basename(f)
-        dur = get_music_duration(f)
+    for entry in music_index.files():
+        dur = entry.get('duration')
         dur_str = ''
         if dur:
             m = int(dur // 60)
             s = int(dur % 60)
             dur_str = f'{m}:{s:02d}'
-        result.append({'name': name, 'duration': dur_str})
-
-    return jsonify({'folder': music_folder, 'files': result})
+        loudness = entry.get('loudness')
+        result.append({
+            'name': entry['name'],
+            'duration': dur_str,
+            'codec': entry.get('codec', ''),
+            'bitrate': entry.get('bitrate', 0),
+            'sample_rate': entry.get('sample_rate', 0),
+            # None = belum diukur (dianalisis di background)
+            'loudness': {
+                'integrated': loudness['integrated'],
+                'true_peak': loudness['true_peak'],
+                'lra': loudness['lra'],
+                'gain': round(LOUDNORM_I - loudness['integrated'], 1) if loudness['integrated'] is not None else None,
+            } if loudness else None,
+        })
+
+    return jsonify({'folder': music_folder, 'files': result,
+                    'loudnorm': {'enabled': LOUDNORM, 'target_i': LOUDNORM_I, 'target_tp': LOUDNORM_TP,
+                                 'target_lra': LOUDNORM_LRA}})
 
 
 @app.route('/music/<filename>')
 def serve_music(filename):
     """Serve a music file for preview."""
-    music_folder = get_music_folder()
-    return send_from_directory(music_folder, filename)
+    path = find_media([get_music_folder()], filename)
+    if not path:
+        abort(404)
+    return send_media(path)
 
 
 @app.route('/create', methods=['POST'])
@@ -291,52 +2756,293 @@ def create():
     if not os.path.exists(music_path):
         return jsonify({'error': f'File musik tidak ditemukan: {music_filename}'}), 400
 
-    task_id = str(uuid.uuid4())
-    output_filename = f"video_{task_id}.mp4"
-    output_path = os.path.join(HASIL_VIDEO_FOLDER, output_filename)
-
-    thread = threading.Thread(
-        target=create_video_task,
-        args=(task_id, image_path, music_path, output_path)
+    profile = data.get('profile') or DEFAULT_RENDER_PROFILE
+    if profile not in RENDER_PROFILES:
+        return jsonify({'error': f'Profil render tidak dikenal: {profile}'}), 400
+    try:
+        renditions = parse_renditions(data.get('renditions'))
+        priority = parse_priority(data.get('priority'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    task_id = submit_render(
+        'video', image_path, music_path, profile,
+        lambda task_id, output_path: (image_path, music_path, output_path, profile, renditions),
+        priority=priority, renditions=renditions
     )
-    thread.daemon = True
-    thread.start()
 
     return jsonify({'task_id': task_id})
 
 
 @app.route('/progress/<task_id>')
 def get_progress(task_id):
+    # ?since=<version> -> long-poll: tahan request sampai ada perubahan (maks 25 dtk)
+    since = request.args.get('since', type=int)
+    if since is not None:
+        progress_store.wait([task_id], since, timeout=PROGRESS_LONGPOLL_TIMEOUT)
+    _, version = progress_store.changes([task_id], 0)
     data = progress_store.get(task_id, {'status': 'pending', 'progress': 0})
+    data['version'] = version
     return jsonify(data)
 
 
+PROGRESS_LONGPOLL_TIMEOUT = 25
+PROGRESS_SSE_PING = 15
+
+
+def progress_events(task_ids):
+    """Generator SSE: kirim snapshot awal lalu setiap perubahan progress.
+
+    Kalau task_ids diberikan, stream selesai setelah semua task done/error.
+    """
+    since = 0
+    if task_ids:
+        for t in task_ids:
+            if progress_store.get(t) is None:
+                data = {'task_id': t, 'status': 'pending', 'progress': 0}
+                yield f'event: progress\ndata: {json.dumps(data)}\n\n'
+    while True:
+        changed, since = progress_store.changes(task_ids, since)
+        for t, data in changed.items():
+            data['task_id'] = t
+            yield f'event: progress\ndata: {json.dumps(data)}\n\n'
+        if task_ids:
+            states = [progress_store.get(t, {}).get('status') for t in task_ids]
+            if all(st in ('done', 'error') for st in states):
+                yield 'event: end\ndata: {}\n\n'
+                return
+        if not progress_store.wait(task_ids, since, timeout=PROGRESS_SSE_PING):
+            yield ': ping\n\n'
+
+
+def sse_response(gen):
+    return Response(gen, mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+
+
+@app.route('/progress/<task_id>/stream')
+def stream_progress(task_id):
+    return sse_response(progress_events([task_id]))
+
+
+@app.route('/progress/stream')
+def stream_progress_multi():
+    """Satu koneksi SSE untuk banyak job: ?ids=a,b,c (kosong = semua job)."""
+    ids = [t for t in request.args.get('ids', '').split(',') if t]
+    return sse_response(progress_events(ids or None))
+
+
+@app.route('/render-profiles')
+def render_profiles():
+    return jsonify({'default': DEFAULT_RENDER_PROFILE, 'profiles': RENDER_PROFILES})
+
+
+@app.route('/encoder-tuning')
+def encoder_tuning():
+    """Kalibrasi encoder + keputusan preset/threads terakhir (untuk inspeksi)."""
+    queued = render_queue.stats()['queue_depth']
+    return jsonify({
+        'enabled': AUTOTUNE,
+        'cores': os.cpu_count(),
+        'max_workers': RENDER_WORKERS,
+        'target_latency': RENDER_TARGET_LATENCY,
+        'concurrency_now': encoder_tuner.concurrency(queued),
+        'calibration': encoder_tuner.calibration,
+        'decisions': list(encoder_tuner.decisions),
+    })
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Metrics Prometheus gabungan semua proses + gauge antrian dari database."""
+    metrics.flush()
+    conn = get_db()
+    gauges = []
+    stats = render_queue.stats()
+    gauges.append(('mvfi_render_queue_depth', {}, stats['queue_depth']))
+    for status, n in stats['counts'].items():
+        gauges.append(('mvfi_render_jobs', {'status': status}, n))
+    for r in conn.execute('SELECT status, COUNT(*) AS n FROM sent_log GROUP BY status'):
+        gauges.append(('mvfi_web1_deliveries', {'status': r['status']}, r['n']))
+    gauges.append(('mvfi_used_images', {}, conn.execute('SELECT COUNT(*) FROM used_images').fetchone()[0]))
+    return Response(metrics.render(gauges), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/jobs')
+def list_jobs():
+    return jsonify({'stats': render_queue.stats(), 'jobs': render_queue.list()})
+
+
+@app.route('/jobs/<job_id>')
+def get_job(job_id):
+    job = render_queue.get(job_id)
+    if not job:
+        return jsonify({'error': 'Job tidak ditemukan'}), 404
+    job['progress'] = progress_store.get(job_id, {})
+    return jsonify(job)
+
+
 @app.route("/download/<filename>")
 def download(filename):
     # Cari di hasil_video dulu, fallback ke outputs
-    path = os.path.join(HASIL_VIDEO_FOLDER, filename)
-    if not os.path.exists(path):
-        path = os.path.join(OUTPUT_FOLDER, filename)
-    if not os.path.exists(path):
+    path = find_media([HASIL_VIDEO_FOLDER, OUTPUT_FOLDER], filename)
+    if not path:
         return "File not found", 404
-    return send_file(path, as_attachment=True, download_name=filename)
-
-
-## ─── PIN HISTORY HELPERS ───
-
-def load_pin_history():
-    if os.path.exists(PIN_HISTORY_FILE):
+    return send_media(path, immutable=True, as_attachment=True)
+
+
+# ─── PINTEREST CACHE ──────────────────────────────────────
+# Hasil search disimpan per query (TTL + stale-while-revalidate) dan gambar
+# yang tampil di-prefetch ke cache/pins. PINTEREST_API_URL bisa diarahkan
+# ke API lokal untuk testing.
+PINTEREST_API_URL = os.environ.get('PINTEREST_API_URL', 'https://api.nexray.web.id/search/pinterest')
+PIN_SEARCH_TTL = int(os.environ.get('PIN_SEARCH_TTL', 600))         # detik, dianggap segar
+PIN_SEARCH_STALE = int(os.environ.get('PIN_SEARCH_STALE', 3600))    # detik, masih boleh dipakai sambil refresh
+PIN_SEARCH_MAX_QUERIES = 200
+PIN_IMAGE_CACHE_FOLDER = os.path.join(BASE_DIR, 'cache', 'pins')
+PIN_IMAGE_CACHE_MAX_MB = int(os.environ.get('PIN_IMAGE_CACHE_MAX_MB', 300))
+PIN_PREFETCH_WORKERS = int(os.environ.get('PIN_PREFETCH_WORKERS', 8))
+PIN_IMAGE_HEADERS = {'User-Agent': 'Mozilla/5.0', 'Referer': 'https://www.pinterest.com/'}
+
+
+def fetch_pinterest(q):
+    """Panggil API search Pinterest; return list hasil (bisa kosong)."""
+    url = f"{PINTEREST_API_URL}?q={urllib.parse.quote(q)}"
+    req = urllib.request.Request(url, headers={'User-Agent': 'Mozilla/5.0'})
+    with urllib.request.urlopen(req, timeout=15) as resp:
+        data = json.loads(resp.read().decode('utf-8'))
+    if not data.get('status'):
+        return []
+    return data.get('result') or []
+
+
+class PinSearchCache:
+    def __init__(self, fetch, ttl, stale, max_queries):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.stale = stale
+        self.max_queries = max_queries
+        self._entries = {}  # q -> (fetched_at, results)
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def _store(self, q, results):
+        with self._lock:
+            self._entries[q] = (time.time(), results)
+            if len(self._entries) > self.max_queries:
+                oldest = min(self._entries, key=lambda k: self._entries[k][0])
+                del self._entries[oldest]
+
+    def _refresh(self, q):
         try:
-            with open(PIN_HISTORY_FILE, 'r') as f:
-                return json.load(f)
-        except:
-            pass
-    return {}
-
+            self._store(q, self.fetch(q))
+        except Exception as e:
+            print(f"pinterest refresh error ({q}): {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(q)
+
+    def get(self, q):
+        with self._lock:
+            entry = self._entries.get(q)
+        if entry:
+            age = time.time() - entry[0]
+            if age < self.ttl:
+                return entry[1]
+            if age < self.stale:
+                with self._lock:
+                    start = q not in self._refreshing
+                    self._refreshing.add(q)
+                if start:
+                    threading.Thread(target=self._refresh, args=(q,), daemon=True).start()
+                return entry[1]
+        results = self.fetch(q)
+        self._store(q, results)
+        return results
+
+
+class PinImageCache:
+    """Cache gambar Pinterest di disk (nama = sha1 URL), dibatasi ukuran total (LRU)."""
+
+    def __init__(self, folder, max_bytes, workers):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='pin-prefetch')
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def _path(self, url):
+        ext = '.jpg'
+        lower = urllib.parse.urlsplit(url).path.lower()
+        if lower.endswith('.png'):
+            ext = '.png'
+        elif lower.endswith('.webp'):
+            ext = '.webp'
+        return os.path.join(self.folder, hashlib.sha1(url.encode()).hexdigest() + ext)
+
+    def get(self, url):
+        """Path gambar kalau sudah ada di cache, else None."""
+        path = self._path(url)
+        if os.path.exists(path):
+            os.utime(path)
+            return path
+        return None
 
-def save_pin_history(data):
-    with open(PIN_HISTORY_FILE, 'w') as f:
-        json.dump(data, f, indent=2)
+    def _download(self, url):
+        try:
+            path = self.get(url)
+            if path:
+                return path
+            with timed_stage('image_download') as info:
+                req = urllib.request.Request(url, headers=PIN_IMAGE_HEADERS)
+                with urllib.request.urlopen(req, timeout=20) as resp:
+                    img_data = resp.read()
+                # pastikan memang gambar yang bisa dibuka, bukan halaman error
+                with Image.open(io.BytesIO(img_data)) as img:
+                    img.verify()
+                info['bytes'] = len(img_data)
+            metrics.inc('mvfi_bytes_total', len(img_data), stage='image_download', direction='in')
+            # hash per URL sekarang, selagi bytes masih di memory (dipakai deteksi foto mirip)
+            set_image_dhash(f'url:{url}', image_dhash(io.BytesIO(img_data)))
+            os.makedirs(self.folder, exist_ok=True)
+            path = self._path(url)
+            tmp = f'{path}.{uuid.uuid4().hex}.tmp'
+            with open(tmp, 'wb') as f:
+                f.write(img_data)
+            os.replace(tmp, path)
+            self.prune()
+            return path
+        finally:
+            with self._lock:
+                self._inflight.pop(url, None)
+
+    def fetch_async(self, url):
+        """Future yang menghasilkan path gambar di cache."""
+        with self._lock:
+            fut = self._inflight.get(url)
+            if fut is None:
+                fut = self._executor.submit(self._download, url)
+                self._inflight[url] = fut
+            return fut
+
+    def prefetch(self, urls):
+        for url in urls:
+            if url and not os.path.exists(self._path(url)):
+                self.fetch_async(url)
+
+    def fetch(self, url):
+        """Path gambar di cache; tunggu prefetch yang sedang jalan atau download sekarang."""
+        return self.get(url) or self.fetch_async(url).result()
+
+    def prune(self):
+        with self._lock:
+            prune_cache_folder(self.folder, self.max_bytes)
+
+
+pin_search_cache = PinSearchCache(fetch_pinterest, PIN_SEARCH_TTL, PIN_SEARCH_STALE, PIN_SEARCH_MAX_QUERIES)
+pin_image_cache = PinImageCache(PIN_IMAGE_CACHE_FOLDER, PIN_IMAGE_CACHE_MAX_MB * 1024 * 1024, PIN_PREFETCH_WORKERS)
 
 
 @app.route('/pinterest/search')
@@ -345,39 +3051,35 @@ def pinterest_search():
     if not q:
         return jsonify({'error': 'Query kosong'}), 400
 
-    # Kumpulkan URL foto yang sudah dijadikan video (filter utama)
-    log_path = os.path.join(HASIL_VIDEO_FOLDER, 'log.json')
-    used_thumb_urls = set()
-    if os.path.exists(log_path):
-        try:
-            with open(log_path) as f:
-                log_data = json.load(f)
-            used_thumb_urls = set(e.get('thumb_url', '') for e in log_data if e.get('thumb_url'))
-        except:
-            pass
-
     # seen_ids untuk rotasi tampilan (bukan filter keras)
-    history = load_pin_history()
-    seen_ids = set(history.get(q, []))
-
-    encoded_q = urllib.parse.quote(q)
-    url = f"https://api.nexray.web.id/search/pinterest?q={encoded_q}"
+    seen_history = get_pin_seen(q)
+    seen_ids = set(seen_history)
 
     try:
-        req = urllib.request.Request(url, headers={'User-Agent': 'Mozilla/5.0'})
-        with urllib.request.urlopen(req, timeout=15) as resp:
-            raw = resp.read().decode('utf-8')
-        data = json.loads(raw)
+        results = pin_search_cache.get(q)
     except Exception as e:
         return jsonify({'error': f'Gagal menghubungi API: {str(e)}'}), 500
 
-    if not data.get('status') or not data.get('result'):
+    if not results:
         return jsonify({'error': 'Tidak ada hasil dari Pinterest'}), 404
 
-    results = data['result']
+    # salinan, karena list aslinya dipakai bersama di cache
+    results = [dict(r) for r in results]
+
+    # URL foto yang sudah dijadikan video (filter utama)
+    used_thumb_urls = find_used_thumb_urls(r.get('images_url', '') for r in results)
 
-    # Filter keras: buang yang sudah dijadikan video
-    not_used = [r for r in results if r.get('images_url', '') not in used_thumb_urls]
+    # Foto sama dari URL lain (CDN / ukuran beda): cek dHash gambar yang sudah pernah di-download
+    for r in results:
+        url = r.get('images_url', '')
+        if url and url not in used_thumb_urls:
+            match = duplicate_index.find_url(url, pin_image_cache.get(url))
+            if match:
+                r['near_duplicate'] = match
+
+    # Filter keras: buang yang sudah dijadikan video (atau mirip dengan video lain)
+    not_used = [r for r in results
+                if r.get('images_url', '') not in used_thumb_urls and not r.get('near_duplicate')]
 
     # Dari yang belum dijadikan video, utamakan yang belum pernah tampil
     not_seen = [r for r in not_used if r.get('id') not in seen_ids]
@@ -387,7 +3089,7 @@ def pinterest_search():
         selected = not_seen[:10]
     elif len(not_used) >= 1:
         # Semua sudah pernah tampil tapi belum dijadikan video — reset rotasi
-        history[q] = []
+        seen_history = []
         selected = not_used[:10]
     else:
         # Semua sudah dijadikan video — tampilkan semua (user mungkin mau pilih lagi)
@@ -395,129 +3097,285 @@ def pinterest_search():
 
     # Catat yang ditampilkan ke seen_ids
     new_ids = [r.get('id') for r in selected if r.get('id')]
-    all_seen = list(history.get(q, [])) + new_ids
-    history[q] = all_seen[-200:]
-    save_pin_history(history)
+    all_seen = seen_history + new_ids
+    set_pin_seen(q, all_seen[-200:])
 
     # Tandai foto yang sudah pernah dijadikan video
     for r in selected:
-        r['already_used'] = r.get('images_url', '') in used_thumb_urls
+        r['already_used'] = r.get('images_url', '') in used_thumb_urls or bool(r.get('near_duplicate'))
+
+    # Download gambar yang tampil di background supaya /pin-make bisa langsung encode
+    pin_image_cache.prefetch(r.get('images_url') for r in selected if not r['already_used'])
 
     return jsonify({'status': True, 'result': selected})
 
 
+def store_pin_image(cached_path):
+    """Salin gambar dari cache Pinterest ke uploads (content-addressed). Return path."""
+    ext = os.path.splitext(cached_path)[1]
+    # salin dari cache: file cache bisa terhapus (LRU) sebelum job render jalan
+    with open(cached_path, 'rb') as f:
+        img_filename, _, _ = save_content_addressed(f, ext)
+    return os.path.join(UPLOAD_FOLDER, img_filename)
+
+
+def queue_pin_render(cached_path, image_url, pin_title, music_path, profile, priority=5, renditions=None):
+    """Salin gambar dari cache ke uploads lalu antrikan job render pin. Return task_id."""
+    img_path = store_pin_image(cached_path)
+
+    return submit_render(
+        'pin', img_path, music_path, profile,
+        lambda task_id, output_path: (img_path, music_path, output_path, pin_title, image_url, profile, renditions),
+        priority=priority, renditions=renditions
+    )
+
+
 @app.route('/pin-make', methods=['POST'])
 def pin_make():
     data = request.json
     image_url = data.get('image_url')
     if not image_url:
         return jsonify({'error': 'No image_url'}), 400
+    profile = data.get('profile') or DEFAULT_RENDER_PROFILE
+    if profile not in RENDER_PROFILES:
+        return jsonify({'error': f'Profil render tidak dikenal: {profile}'}), 400
+    try:
+        renditions = parse_renditions(data.get('renditions'))
+        priority = parse_priority(data.get('priority'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
     try:
-        req = urllib.request.Request(image_url, headers={'User-Agent': 'Mozilla/5.0', 'Referer': 'https://www.pinterest.com/'})
-        with urllib.request.urlopen(req, timeout=20) as resp:
-            img_data = resp.read()
+        cached_path = pin_image_cache.fetch(image_url)
     except Exception as e:
         return jsonify({'error': f'Gagal download gambar: {str(e)}'}), 500
 
-    ext = '.jpg'
-    if image_url.lower().endswith('.png'):
-        ext = '.png'
-    elif image_url.lower().endswith('.webp'):
-        ext = '.webp'
-
-    img_filename = f"pin_{uuid.uuid4()}{ext}"
-    img_path = os.path.join(UPLOAD_FOLDER, img_filename)
-    with open(img_path, 'wb') as f:
-        f.write(img_data)
-
-    music_folder = get_music_folder()
-    music_files = []
-    for mext in MUSIC_EXTENSIONS:
-        music_files.extend(glob.glob(os.path.join(music_folder, f'*{mext}')))
-        music_files.extend(glob.glob(os.path.join(music_folder, f'*{mext.upper()}')))
-    music_files = list(set(music_files))
+    # foto mirip video lain -> tolak kecuali allow_duplicate (render ulang foto yang
+    # persis sama tetap lewat render cache)
+    match = duplicate_index.find_url(image_url, cached_path)
+    if match and match['image_sha'] != file_sha256(cached_path) and not data.get('allow_duplicate'):
+        return jsonify({'error': 'Foto ini mirip dengan video yang sudah dibuat',
+                        'near_duplicate': match}), 409
 
+    music_files = list_music_files(get_music_folder())
     if not music_files:
         return jsonify({'error': 'Tidak ada file musik. Tambahkan musik ke folder music/'}), 400
 
-    music_path = random.choice(music_files)
-    music_name = os.path.basename(music_path)
+    task_id = queue_pin_render(cached_path, image_url, data.get('title', 'Pinterest Video'),
+                               random.choice(music_files), profile, priority, renditions)
+
+    return jsonify({'task_id': task_id})
+
 
-    task_id = str(uuid.uuid4())
-    output_filename = f"pinvid_{task_id}.mp4"
-    output_path = os.path.join(HASIL_VIDEO_FOLDER, output_filename)
+# ─── PIN BATCH ────────────────────────────────────────────
+# Banyak video Pinterest sekali jalan: gambar di-download paralel, tiap gambar
+# yang selesai langsung masuk antrian render (jadi encode jalan sambil download
+# sisanya), progress semua job digabung di progress_store[batch_id].
+PIN_BATCH_MAX = 200
+
+
+def collect_pin_candidates(query=None, urls=None):
+    """List {'images_url', 'title'} dari hasil search dan/atau daftar URL, tanpa duplikat."""
+    items = []
+    if query:
+        for r in pin_search_cache.get(query):
+            items.append({'images_url': r.get('images_url', ''),
+                          'title': r.get('grid_title') or r.get('description') or 'Pinterest Video'})
+    for u in urls or []:
+        items.append({'images_url': u, 'title': 'Pinterest Video'})
+    seen = set()
+    unique = []
+    for it in items:
+        if it['images_url'] and it['images_url'] not in seen:
+            seen.add(it['images_url'])
+            unique.append(it)
+    return unique
+
+
+def start_pin_batch(query=None, urls=None, count=10, profile=None, priority=5, renditions=None):
+    """Mulai batch di background. Return (batch_id, jumlah kandidat, skipped)."""
+    profile = profile or DEFAULT_RENDER_PROFILE
+    candidates = collect_pin_candidates(query, urls)
+    used = find_used_thumb_urls(c['images_url'] for c in candidates)
+    skipped = [{'images_url': c['images_url'], 'reason': 'sudah dijadikan video'}
+               for c in candidates if c['images_url'] in used]
+    items = [c for c in candidates if c['images_url'] not in used][:max(1, min(count, PIN_BATCH_MAX))]
+
+    batch_id = f'batch_{uuid.uuid4()}'
+    progress_store.set(batch_id, {
+        'status': 'processing', 'type': 'batch', 'progress': 0,
+        'message': f'Download {len(items)} gambar...',
+        'query': query, 'requested': count, 'total': len(items),
+        'done': 0, 'failed': 0, 'task_ids': [], 'skipped': skipped,
+    })
+    threading.Thread(target=run_pin_batch, args=(batch_id, items, profile, priority, renditions),
+                     name=batch_id, daemon=True).start()
+    return batch_id, len(items), skipped
 
-    pin_title = data.get('title', 'Pinterest Video')
 
-    thread = threading.Thread(
-        target=create_pin_video_task,
-        args=(task_id, img_path, music_path, output_path, pin_title, image_url)
+def run_pin_batch(batch_id, items, profile, priority, renditions=None):
+    started = time.time()
+    music_files = list_music_files(get_music_folder())
+    if not music_files:
+        progress_store.update(batch_id, status='error', message='Tidak ada file musik.')
+        return
+    if not items:
+        progress_store.update(batch_id, status='done', progress=100, message='Tidak ada gambar baru.')
+        return
+
+    # download paralel; yang selesai duluan langsung diantrikan ke render
+    futures = {pin_image_cache.fetch_async(it['images_url']): it for it in items}
+    task_ids = []
+    skipped = list(progress_store.get(batch_id, {}).get('skipped', []))
+    for fut in as_completed(futures):
+        it = futures[fut]
+        try:
+            cached_path = fut.result()
+        except Exception as e:
+            skipped.append({'images_url': it['images_url'], 'reason': f'download gagal: {e}'})
+            continue
+        match = duplicate_index.find_url(it['images_url'], cached_path)
+        if match:
+            skipped.append({'images_url': it['images_url'], 'reason': 'mirip video lain',
+                            'near_duplicate': match})
+            continue
+        task_ids.append(queue_pin_render(cached_path, it['images_url'], it['title'],
+                                         random.choice(music_files), profile, priority, renditions))
+        progress_store.update(batch_id, task_ids=list(task_ids), skipped=list(skipped),
+                              message=f'{len(task_ids)}/{len(items)} gambar siap, encoding...')
+    progress_store.update(batch_id, task_ids=list(task_ids), skipped=list(skipped), total=len(task_ids))
+
+    # gabungkan progress job-job render
+    since = 0
+    while task_ids:
+        _, since = progress_store.changes(task_ids, since)
+        states = [progress_store.get(t, {}) for t in task_ids]
+        done = sum(1 for st in states if st.get('status') == 'done')
+        failed = sum(1 for st in states if st.get('status') == 'error')
+        pct = sum(100 if st.get('status') in ('done', 'error') else st.get('progress', 0)
+                  for st in states) // len(task_ids)
+        progress_store.update(batch_id, progress=pct, done=done, failed=failed,
+                              message=f'{done}/{len(task_ids)} video selesai' + (f', {failed} gagal' if failed else ''))
+        if done + failed == len(task_ids):
+            break
+        progress_store.wait(task_ids, since, timeout=30)
+
+    states = [progress_store.get(t, {}) for t in task_ids]
+    progress_store.update(
+        batch_id,
+        status='done', progress=100,
+        elapsed=round(time.time() - started, 1),
+        videos=[st.get('output_filename') for st in states if st.get('status') == 'done'],
+        errors=[{'task_id': t, 'message': st.get('message')}
+                for t, st in zip(task_ids, states) if st.get('status') == 'error'],
     )
-    thread.daemon = True
-    thread.start()
 
-    return jsonify({'task_id': task_id})
 
+@app.route('/pin-make/batch', methods=['POST'])
+def pin_make_batch():
+    """Body: {"query": "...", "urls": [...], "count": 20, "profile": "still", "renditions": [...]}
 
-def create_pin_video_task(task_id, image_path, music_path, output_path, pin_title, thumb_url):
+    (query / urls salah satu; renditions opsional, lihat RENDITION_PRESETS).
+    """
+    data = request.json or {}
+    query = (data.get('query') or '').strip()
+    urls = data.get('urls') or []
+    if not query and not urls:
+        return jsonify({'error': 'query atau urls wajib diisi'}), 400
+    profile = data.get('profile') or DEFAULT_RENDER_PROFILE
+    if profile not in RENDER_PROFILES:
+        return jsonify({'error': f'Profil render tidak dikenal: {profile}'}), 400
     try:
-        progress_store[task_id] = {'status': 'processing', 'progress': 0, 'message': 'Memulai...', 'type': 'pin'}
+        count = int(data.get('count', 10))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'count harus angka'}), 400
+    try:
+        renditions = parse_renditions(data.get('renditions'))
+        priority = parse_priority(data.get('priority'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        batch_id, total, skipped = start_pin_batch(query, urls, count, profile, priority, renditions)
+    except Exception as e:
+        return jsonify({'error': f'Gagal menghubungi API: {str(e)}'}), 500
+    return jsonify({'batch_id': batch_id, 'total': total, 'skipped': len(skipped)}), 202
+
+
+def batch_cli(argv):
+    """python main.py batch --query "aesthetic" --count 50 [--urls-file pins.txt] [--profile still]
+    [--renditions 1080p,shorts]"""
+    import argparse
+    parser = argparse.ArgumentParser(prog='main.py batch', description='Bikin banyak video Pinterest sekaligus')
+    parser.add_argument('--query', help='kata kunci search Pinterest')
+    parser.add_argument('--urls-file', help='file berisi URL gambar, satu per baris')
+    parser.add_argument('--count', type=int, default=10)
+    parser.add_argument('--profile', default=DEFAULT_RENDER_PROFILE, choices=sorted(RENDER_PROFILES))
+    parser.add_argument('--renditions', help=f'preset rendition pisah koma ({", ".join(RENDITION_PRESETS)})')
+    args = parser.parse_args(argv)
+    try:
+        renditions = parse_renditions(args.renditions)
+    except ValueError as e:
+        parser.error(str(e))
+    urls = []
+    if args.urls_file:
+        with open(args.urls_file) as f:
+            urls = [line.strip() for line in f if line.strip()]
+    if not args.query and not urls:
+        parser.error('--query atau --urls-file wajib diisi')
+
+    for folder in (UPLOAD_FOLDER, OUTPUT_FOLDER, HASIL_VIDEO_FOLDER):
+        os.makedirs(folder, exist_ok=True)
+    metrics.start()
+    music_index.start()
+    duplicate_index.start()
+    render_queue.start()
+    batch_id, total, skipped = start_pin_batch(args.query, urls, args.count, args.profile, renditions=renditions)
+    print(f'{batch_id}: {total} gambar, {len(skipped)} dilewati')
+    since = 0
+    while True:
+        progress_store.wait([batch_id], since, timeout=30)
+        changed, since = progress_store.changes([batch_id], since)
+        st = progress_store.get(batch_id, {})
+        if changed:
+            print(f"[{st.get('progress', 0):3d}%] {st.get('message', '')}", flush=True)
+        if st.get('status') in ('done', 'error'):
+            break
+    print(json.dumps(progress_store.get(batch_id), indent=2))
+
+
+def create_pin_video_task(task_id, image_path, music_path, output_path, pin_title, thumb_url, profile=None,
+                          renditions=None):
+    profile = profile or DEFAULT_RENDER_PROFILE
+    try:
+        renditions = parse_renditions(renditions)
+        progress_store.set(task_id, {'status': 'processing', 'progress': 0, 'message': 'Memulai...', 'type': 'pin'})
 
-        progress_store[task_id]['message'] = 'Membaca durasi musik...'
-        progress_store[task_id]['progress'] = 10
-        duration = get_music_duration(music_path)
+        progress_store.update(task_id, message='Membaca durasi musik...', progress=10)
+        duration = music_index.duration(music_path)
 
         if duration is None or duration <= 0:
-            progress_store[task_id] = {'status': 'error', 'message': 'Gagal membaca durasi musik.', 'type': 'pin'}
+            progress_store.set(task_id, {'status': 'error', 'message': 'Gagal membaca durasi musik.', 'type': 'pin'})
             return
 
-        progress_store[task_id]['progress'] = 20
-        w, h = get_image_size(image_path)
-        new_w, new_h = make_1080p_size(w, h)
+        progress_store.update(task_id, progress=20)
+        frame_path, base_size = prepare_frame(image_path, lambda w, h: rendition_base_size(renditions, w, h))
+        poster = save_poster(task_id, frame_path)
+        outputs = rendition_outputs(renditions, output_path, base_size)
+        new_w, new_h = outputs[0]['size']
 
-        progress_store[task_id]['progress'] = 30
+        progress_store.update(task_id, progress=30)
         music_name = os.path.basename(music_path)
-        progress_store[task_id]['message'] = f'Encoding dengan: {music_name}'
-        progress_store[task_id]['progress'] = 40
-
-        cmd = [
-            'ffmpeg', '-y',
-            '-loop', '1',
-            '-i', image_path,
-            '-i', music_path,
-            '-vf', f'scale={new_w}:{new_h}:flags=lanczos',
-            '-c:v', 'libx264',
-            '-preset', 'medium',
-            '-crf', '18',
-            '-c:a', 'aac',
-            '-b:a', '192k',
-            '-t', str(duration),
-            '-shortest',
-            '-pix_fmt', 'yuv420p',
-            '-movflags', '+faststart',
-            output_path
-        ]
+        progress_store.update(task_id, message=f'Encoding dengan: {music_name}', progress=40)
 
-        progress_store[task_id]['progress'] = 50
-        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-
-        start_time = time.time()
-        estimated = max(duration * 0.5, 5)
-        while proc.poll() is None:
-            elapsed = time.time() - start_time
-            enc_prog = min(45, int((elapsed / estimated) * 45))
-            progress_store[task_id]['progress'] = 50 + enc_prog
-            time.sleep(0.5)
-
-        proc.wait()
-        if proc.returncode != 0:
-            stderr = proc.stderr.read() if proc.stderr else ''
-            progress_store[task_id] = {'status': 'error', 'message': f'FFmpeg error: {stderr[-200:]}', 'type': 'pin'}
+        progress_store.update(task_id, progress=50)
+        returncode, stderr, encoder = render_video(task_id, frame_path, music_path, outputs,
+                                                   base_size, duration, profile)
+        if returncode != 0:
+            progress_store.set(task_id, {'status': 'error', 'message': f'FFmpeg error: {stderr[-200:]}', 'type': 'pin'})
             return
 
-        if not os.path.exists(output_path) or os.path.getsize(output_path) == 0:
-            progress_store[task_id] = {'status': 'error', 'message': 'File video tidak terbuat.', 'type': 'pin'}
+        if any(not os.path.exists(o['path']) or os.path.getsize(o['path']) == 0 for o in outputs):
+            progress_store.set(task_id, {'status': 'error', 'message': 'File video tidak terbuat.', 'type': 'pin'})
             return
 
         output_filename = os.path.basename(output_path)
@@ -530,21 +3388,17 @@ def create_pin_video_task(task_id, image_path, music_path, output_path, pin_titl
             'music': music_name,
             'resolution': f'{new_w}x{new_h}',
             'duration': int(duration),
+            'profile': profile,
+            'image': os.path.basename(image_path),
+            'poster': poster,
+            'encoder': encoder,
             'created_at': time.strftime('%Y-%m-%d %H:%M:%S')
         }
-        log_path = os.path.join(HASIL_VIDEO_FOLDER, 'log.json')
-        log = []
-        if os.path.exists(log_path):
-            try:
-                with open(log_path) as f:
-                    log = json.load(f)
-            except:
-                log = []
-        log.insert(0, log_entry)
-        with open(log_path, 'w') as f:
-            json.dump(log, f, indent=2)
-
-        progress_store[task_id] = {
+        for entry in rendition_log_entries(log_entry, outputs):
+            add_video_log(entry)
+        duplicate_index.add(task_id, image_path, thumb_url)
+
+        progress_store.set(task_id, {
             'status': 'done',
             'progress': 100,
             'message': 'Video selesai!',
@@ -553,42 +3407,312 @@ def create_pin_video_task(task_id, image_path, music_path, output_path, pin_titl
             'music_name': music_name,
             'resolution': f'{new_w}x{new_h}',
             'duration': int(duration),
-            'title': pin_title
+            'profile': profile,
+            'title': pin_title,
+            'renditions': rendition_summary(outputs),
+        })
+
+    except Exception as e:
+        progress_store.set(task_id, {'status': 'error', 'message': str(e), 'type': 'pin'})
+
+
+# ─── SLIDESHOW ────────────────────────────────────────────
+# N foto + satu lagu -> satu video, satu kali encode: tiap foto jadi input
+# sendiri (sudah di-prescale prepare_frame, di-pad ke kanvas), disambung xfade
+# di satu filter graph. Kanvas = make_1080p_size foto pertama (atau lebih
+# besar kalau rendition memerlukannya); lama tiap foto dibagi rata supaya
+# total, setelah dikurangi overlap transisi, pas dengan durasi musik.
+SLIDESHOW_MAX_IMAGES = 30
+SLIDESHOW_FPS = 25  # transisi butuh fps normal, profil still (1 fps) terlalu patah
+SLIDESHOW_TRANSITIONS = ('fade', 'fadeblack', 'fadewhite', 'dissolve', 'slideleft', 'slideright',
+                         'wipeleft', 'wiperight', 'circleopen', 'none')
+SLIDESHOW_DEFAULT_TRANSITION = 'fade'
+SLIDESHOW_TRANSITION_SECONDS = 1.0
+
+
+def slideshow_timing(duration, count, transition_seconds, fps):
+    """Return (detik per foto, detik transisi). Transisi maks 1/3 slot, 0 kalau < 1 frame."""
+    transition_seconds = max(0.0, min(transition_seconds, duration / (2 * count + 1)))
+    if transition_seconds < 1 / fps:
+        transition_seconds = 0.0
+    slot = (duration + (count - 1) * transition_seconds) / count
+    return slot, transition_seconds
+
+
+def build_slideshow_cmd(frame_paths, music_path, outputs, canvas, duration, profile, transition,
+                        transition_seconds, audio_copy=False, preset=None, threads=None):
+    """Command ffmpeg slideshow: satu input per frame, xfade/concat, lalu split per rendition."""
+    p = RENDER_PROFILES[profile]
+    fps = max(p['fps'], SLIDESHOW_FPS)
+    count = len(frame_paths)
+    slot, fade = slideshow_timing(duration, count, transition_seconds, fps)
+    if transition == 'none':
+        fade = 0.0
+    canvas_w, canvas_h = canvas
+    cmd = ['ffmpeg', '-y']
+    for path in frame_paths:
+        # input sedikit lebih panjang dari slot; sisa ekor tertutup transisi / -t
+        cmd += ['-framerate', str(fps), '-loop', '1', '-t', f'{slot + 0.5:.3f}', '-i', path]
+    cmd += ['-i', music_path]
+    parts = [f'[{i}:v]pad={canvas_w}:{canvas_h}:(ow-iw)/2:(oh-ih)/2:black,setsar=1,format=yuv420p,'
+             f'fps={fps}[v{i}]' for i in range(count)]
+    if fade:
+        prev = '[v0]'
+        for i in range(1, count):
+            out = f'[x{i}]'
+            parts.append(f'{prev}[v{i}]xfade=transition={transition}:duration={fade:.3f}:'
+                         f'offset={i * (slot - fade):.3f}{out}')
+            prev = out
+        source = prev
+    else:
+        parts += [f'[v{i}]trim=duration={slot:.3f},setpts=PTS-STARTPTS[t{i}]' for i in range(count)]
+        parts.append(''.join(f'[t{i}]' for i in range(count)) + f'concat=n={count}:v=1:a=0[cat]')
+        source = '[cat]'
+    graph, labels = rendition_graph([o['filter'] or 'null' for o in outputs], source)
+    cmd += ['-filter_complex', ';'.join(parts + [graph])]
+    for o, label in zip(outputs, labels):
+        cmd += ['-map', label, '-map', f'{count}:a:0']
+        cmd += x264_args(profile, preset, threads, o['bitrate'])
+        if p['tune']:
+            cmd += ['-tune', p['tune']]
+        cmd += ['-r', str(fps), '-g', str(fps * STILL_GOP_SECONDS)]
+        cmd += ['-c:a', 'copy'] if audio_copy else ['-c:a', 'aac', '-b:a', AUDIO_BITRATE]
+        cmd += [
+            '-t', str(duration),
+            '-pix_fmt', 'yuv420p',
+            '-movflags', '+faststart',
+            o['path']
+        ]
+    return cmd
+
+
+def create_slideshow_task(task_id, image_paths, music_path, output_path, title, thumb_urls=None,
+                          profile=None, renditions=None, transition=None, transition_seconds=None):
+    profile = profile or DEFAULT_RENDER_PROFILE
+    transition = transition or SLIDESHOW_DEFAULT_TRANSITION
+    if transition_seconds is None:
+        transition_seconds = SLIDESHOW_TRANSITION_SECONDS
+    try:
+        renditions = parse_renditions(renditions)
+        progress_store.set(task_id, {'status': 'processing', 'progress': 0, 'message': 'Memulai...',
+                                     'type': 'slideshow'})
+
+        progress_store.update(task_id, message='Membaca durasi musik...', progress=5)
+        duration = music_index.duration(music_path)
+        if duration is None or duration <= 0:
+            progress_store.set(task_id, {'status': 'error', 'message': 'Gagal membaca durasi musik.',
+                                         'type': 'slideshow'})
+            return
+
+        # foto pertama menentukan kanvas, foto lain dimuatkan ke dalamnya
+        frames = []
+        first, canvas = prepare_frame(image_paths[0], lambda w, h: rendition_base_size(renditions, w, h))
+        frames.append(first)
+        fit = {'width': canvas[0], 'height': canvas[1], 'mode': 'fit'}
+        for i, path in enumerate(image_paths[1:], start=2):
+            progress_store.update(task_id, message=f'Menyiapkan foto {i}/{len(image_paths)}...',
+                                  progress=5 + int(i * 35 / len(image_paths)))
+            frames.append(prepare_frame(path, lambda w, h: rendition_size(fit, w, h))[0])
+        poster = save_poster(task_id, first)
+        outputs = rendition_outputs(renditions, output_path, canvas)
+        new_w, new_h = outputs[0]['size']
+
+        music_name = os.path.basename(music_path)
+        progress_store.update(task_id, message=f'Encoding slideshow dengan: {music_name}', progress=45)
+        cached_audio = audio_cache.get(music_path)
+        fps = max(RENDER_PROFILES[profile]['fps'], SLIDESHOW_FPS)
+        encoder = encoder_tuner.plan(task_id, profile, canvas, duration * fps / RENDER_PROFILES[profile]['fps'])
+        cmd = build_slideshow_cmd(frames, cached_audio or music_path, outputs, canvas, duration, profile,
+                                  transition, transition_seconds, audio_copy=bool(cached_audio),
+                                  preset=encoder['preset'], threads=encoder['threads'])
+        returncode, stderr = run_ffmpeg(cmd, task_id, duration)
+        if returncode != 0:
+            progress_store.set(task_id, {'status': 'error', 'message': f'FFmpeg error: {stderr[-300:]}',
+                                         'type': 'slideshow'})
+            return
+        if any(not os.path.exists(o['path']) or os.path.getsize(o['path']) == 0 for o in outputs):
+            progress_store.set(task_id, {'status': 'error', 'message': 'File video tidak terbuat.',
+                                         'type': 'slideshow'})
+            return
+
+        slot, fade = slideshow_timing(duration, len(frames), transition_seconds, fps)
+        log_entry = {
+            'id': task_id,
+            'title': title,
+            'thumb_url': (thumb_urls or [''])[0],
+            'filename': os.path.basename(output_path),
+            'music': music_name,
+            'resolution': f'{new_w}x{new_h}',
+            'duration': int(duration),
+            'profile': profile,
+            'image': os.path.basename(image_paths[0]),
+            'images': [os.path.basename(p) for p in image_paths],
+            'thumb_urls': thumb_urls or [],
+            'transition': transition if fade else 'none',
+            'seconds_per_image': round(slot, 2),
+            'poster': poster,
+            'encoder': {'preset': encoder['preset'], 'threads': encoder['threads'], 'engine': 'slideshow'},
+            'created_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'source': 'slideshow'
         }
+        for entry in rendition_log_entries(log_entry, outputs):
+            add_video_log(entry)
+        # foto Pinterest ada di ujung daftar (setelah upload), sejajar dengan thumb_urls
+        urls = [''] * (len(image_paths) - len(thumb_urls or [])) + list(thumb_urls or [])
+        for path, url in zip(image_paths, urls):
+            duplicate_index.add(task_id, path, url)
+
+        progress_store.set(task_id, {
+            'status': 'done',
+            'progress': 100,
+            'message': 'Slideshow selesai!',
+            'type': 'slideshow',
+            'output_filename': os.path.basename(output_path),
+            'music_name': music_name,
+            'resolution': f'{new_w}x{new_h}',
+            'duration': int(duration),
+            'profile': profile,
+            'title': title,
+            'images': len(frames),
+            'renditions': rendition_summary(outputs),
+        })
 
     except Exception as e:
-        progress_store[task_id] = {'status': 'error', 'message': str(e), 'type': 'pin'}
+        progress_store.set(task_id, {'status': 'error', 'message': str(e), 'type': 'slideshow'})
+
+
+@app.route('/slideshow', methods=['POST'])
+def slideshow():
+    """Body: {"images": [upload], "image_urls": [pin], "music_filename": "...", "profile": "...",
+    "transition": "fade", "transition_duration": 1, "title": "...", "renditions": [...]}
+
+    images / image_urls boleh dicampur (urutan: images dulu); musik kosong -> acak.
+    """
+    data = request.json or {}
+    names = data.get('images') or []
+    urls = data.get('image_urls') or []
+    if not isinstance(names, list) or not isinstance(urls, list):
+        return jsonify({'error': 'images dan image_urls harus list'}), 400
+    if not 2 <= len(names) + len(urls) <= SLIDESHOW_MAX_IMAGES:
+        return jsonify({'error': f'Slideshow butuh 2-{SLIDESHOW_MAX_IMAGES} gambar'}), 400
+    profile = data.get('profile') or DEFAULT_RENDER_PROFILE
+    if profile not in RENDER_PROFILES:
+        return jsonify({'error': f'Profil render tidak dikenal: {profile}'}), 400
+    transition = data.get('transition') or SLIDESHOW_DEFAULT_TRANSITION
+    if transition not in SLIDESHOW_TRANSITIONS:
+        return jsonify({'error': f'Transisi harus salah satu dari: {", ".join(SLIDESHOW_TRANSITIONS)}'}), 400
+    try:
+        transition_seconds = float(data.get('transition_duration', SLIDESHOW_TRANSITION_SECONDS))
+        renditions = parse_renditions(data.get('renditions'))
+        priority = parse_priority(data.get('priority'))
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+
+    image_paths = []
+    for name in names:
+        path = find_media([UPLOAD_FOLDER], str(name))
+        if not path:
+            return jsonify({'error': f'Image not found: {name}'}), 404
+        image_paths.append(path)
+    futures = [pin_image_cache.fetch_async(u) for u in urls]
+    try:
+        image_paths += [store_pin_image(f.result()) for f in futures]
+    except Exception as e:
+        return jsonify({'error': f'Gagal download gambar: {str(e)}'}), 500
+
+    music_filename = data.get('music_filename')
+    if music_filename:
+        music_path = os.path.join(get_music_folder(), music_filename)
+        if not os.path.exists(music_path):
+            return jsonify({'error': f'File musik tidak ditemukan: {music_filename}'}), 400
+    else:
+        music_files = list_music_files(get_music_folder())
+        if not music_files:
+            return jsonify({'error': 'Tidak ada file musik. Tambahkan musik ke folder music/'}), 400
+        music_path = random.choice(music_files)
+
+    title = data.get('title') or 'Slideshow'
+    task_id = submit_render(
+        'slideshow', image_paths, music_path, profile,
+        lambda task_id, output_path: (image_paths, music_path, output_path, title, urls, profile,
+                                      renditions, transition, transition_seconds),
+        priority=priority, renditions=renditions,
+        variant=f'slideshow:{transition}:{transition_seconds}'
+    )
+    return jsonify({'task_id': task_id})
+
+
+RENDER_TASKS = {
+    'video': create_video_task,
+    'pin': create_pin_video_task,
+    'slideshow': create_slideshow_task,
+}
 
 
 @app.route('/hasil-video/<filename>')
 def serve_hasil_video(filename):
-    return send_from_directory(HASIL_VIDEO_FOLDER, filename)
+    path = find_media([HASIL_VIDEO_FOLDER], filename)
+    if not path:
+        abort(404)
+    return send_media(path, immutable=True)
+
+
+@app.route('/thumb/<video_id>')
+def serve_thumb(video_id):
+    """Poster video: ?size=xs|sm|md|lg. Video lama dibuatkan saat pertama diminta."""
+    size = request.args.get('size', THUMB_DEFAULT_SIZE)
+    if size not in THUMB_SIZES or not THUMB_ID_RE.match(video_id):
+        abort(404)
+    path = thumb_path(video_id, size)
+    if not os.path.exists(path):
+        entry = get_video_by_id(video_id)
+        if not entry or not build_missing_thumbnails(video_id, entry):
+            abort(404)
+    return send_media(path, immutable=True)
+
+
+def build_missing_thumbnails(video_id, entry):
+    """Thumbnail untuk video sebelum fitur ini: dari foto upload, kalau tidak ada dari frame mp4."""
+    image = find_media([UPLOAD_FOLDER], entry.get('image') or '')
+    if image:
+        make_thumbnails(video_id, image)
+        return True
+    video = find_media([HASIL_VIDEO_FOLDER, OUTPUT_FOLDER], entry.get('filename', ''))
+    if not video:
+        return False
+    tmp = os.path.join(THUMB_FOLDER, f'{video_id}.{uuid.uuid4().hex}.frame.png')
+    os.makedirs(THUMB_FOLDER, exist_ok=True)
+    try:
+        result = subprocess.run(['ffmpeg', '-y', '-v', 'error', '-i', video, '-frames:v', '1', tmp],
+                                capture_output=True, text=True)
+        if result.returncode != 0 or not os.path.exists(tmp):
+            return False
+        make_thumbnails(video_id, tmp)
+        return True
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
 
 
 @app.route('/hasil-video/log')
 def get_video_log():
-    log_path = os.path.join(HASIL_VIDEO_FOLDER, 'log.json')
-    if not os.path.exists(log_path):
-        return jsonify([])
-    try:
-        with open(log_path) as f:
-            return jsonify(json.load(f))
-    except:
-        return jsonify([])
+    """?source=pin|maker &music= &date_from= &date_to= &sent=0|1, plus paging log_listing."""
+    filters = _date_filters('created_at') + _sent_filter()
+    if request.args.get('source'):
+        filters.append(('t.source = ?', [request.args['source']]))
+    if request.args.get('music'):
+        filters.append(('t.music = ?', [request.args['music']]))
+    return log_listing('videos', filters, with_sent=True)
 
 
 @app.route('/hasil-video/delete/<filename>', methods=['DELETE'])
 def delete_hasil_video(filename):
-    log_path = os.path.join(HASIL_VIDEO_FOLDER, 'log.json')
-    if os.path.exists(log_path):
-        try:
-            with open(log_path) as f:
-                log = json.load(f)
-            log = [e for e in log if e.get('filename') != filename]
-            with open(log_path, 'w') as f:
-                json.dump(log, f, indent=2)
-        except:
-            pass
+    entry = get_video_entry(filename)
+    delete_video_log(filename)
+    delete_render_cache(filename)
+    if entry and entry.get('id') and not get_video_by_id(entry['id']):
+        delete_thumbnails(entry['id'])  # poster dipakai bersama semua rendition job ini
+        duplicate_index.remove(entry['id'])
     fpath = os.path.join(HASIL_VIDEO_FOLDER, filename)
     if os.path.exists(fpath):
         os.remove(fpath)
@@ -597,146 +3721,379 @@ def delete_hasil_video(filename):
 
 @app.route('/download-hasil/<filename>')
 def download_hasil(filename):
-    path = os.path.join(HASIL_VIDEO_FOLDER, filename)
-    if not os.path.exists(path):
+    path = find_media([HASIL_VIDEO_FOLDER], filename)
+    if not path:
         return 'File not found', 404
-    return send_file(path, as_attachment=True, download_name=filename)
+    return send_media(path, immutable=True, as_attachment=True)
 
 
 # ─── SENT LOG ─────────────────────────────────────────────
 
-def load_sent_log():
-    """Load daftar video yang sudah di-send ke web 1."""
-    if not os.path.exists(SENT_LOG_FILE):
-        return []
+# ─── WEB 1 UPLOAD ─────────────────────────────────────────
+# Body multipart dibaca bertahap dari disk, jadi memory tetap kecil berapa pun
+# ukuran videonya. Endpoint submit web 1 tidak punya protokol resume, jadi
+# retry mengirim ulang dari awal (file dibuka lagi, bukan disimpan di memory).
+# Header Idempotency-Key sama untuk semua retry satu pengiriman.
+WEB1_UPLOAD_CHUNK = 256 * 1024
+WEB1_UPLOAD_RETRIES = int(os.environ.get('WEB1_UPLOAD_RETRIES', 5))
+WEB1_UPLOAD_TIMEOUT = 300
+WEB1_BACKOFF_MAX = 60
+WEB1_SEND_WORKERS = int(os.environ.get('WEB1_SEND_WORKERS', 2))
+
+
+class MultipartFileBody:
+    """multipart/form-data berisi field teks + satu file, dibaca per chunk.
+
+    Bisa langsung dipakai sebagai `data` urllib/http.client (punya read()).
+    """
+
+    def __init__(self, fields, file_field, file_path, filename, content_type='video/mp4', on_read=None):
+        self.boundary = '----FormBoundary' + uuid.uuid4().hex
+        head = b''.join(
+            f'--{self.boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+            for name, value in fields.items()
+        )
+        head += (
+            f'--{self.boundary}\r\nContent-Disposition: form-data; name="{file_field}"; '
+            f'filename="{filename}"\r\nContent-Type: {content_type}\r\n\r\n'
+        ).encode()
+        self._head = head
+        self._tail = f'\r\n--{self.boundary}--\r\n'.encode()
+        self._file_path = file_path
+        self._file = None
+        self._stage = 0  # 0 = head, 1 = file, 2 = tail, 3 = selesai
+        self._pos = 0
+        self.file_size = os.path.getsize(file_path)
+        self.length = len(head) + self.file_size + len(self._tail)
+        self.sent = 0
+        self.on_read = on_read
+
+    @property
+    def content_type(self):
+        return f'multipart/form-data; boundary={self.boundary}'
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = WEB1_UPLOAD_CHUNK
+        chunk = b''
+        while not chunk and self._stage < 3:
+            if self._stage == 0:
+                chunk = self._head[self._pos:self._pos + size]
+                self._pos += len(chunk)
+                if self._pos >= len(self._head):
+                    self._stage, self._pos = 1, 0
+                    self._file = open(self._file_path, 'rb')
+            elif self._stage == 1:
+                chunk = self._file.read(size)
+                if not chunk:
+                    self._file.close()
+                    self._stage = 2
+            else:
+                chunk = self._tail[self._pos:self._pos + size]
+                self._pos += len(chunk)
+                if self._pos >= len(self._tail):
+                    self._stage = 3
+        self.sent += len(chunk)
+        if chunk and self.on_read:
+            self.on_read(self.sent, self.length)
+        return chunk
+
+    def close(self):
+        if self._file:
+            self._file.close()
+
+
+class Web1ConnectionPool:
+    """Pool koneksi keep-alive (http.client) ke web 1."""
+
+    def __init__(self, base_url, size):
+        parts = urllib.parse.urlsplit(base_url)
+        self.https = parts.scheme == 'https'
+        self.host = parts.hostname
+        self.port = parts.port
+        self.base_path = parts.path.rstrip('/')
+        self._idle = queue.LifoQueue(maxsize=size)
+
+    def _new(self):
+        cls = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+        return cls(self.host, self.port, timeout=WEB1_UPLOAD_TIMEOUT, blocksize=WEB1_UPLOAD_CHUNK)
+
+    def request(self, method, path, body=None, headers=None):
+        """Return (status, bytes body). Koneksi dipakai ulang kalau server mengizinkan."""
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._new()
+        try:
+            conn.request(method, self.base_path + path, body=body, headers=headers or {})
+            resp = conn.getresponse()
+            data = resp.read()
+        except Exception:
+            conn.close()
+            raise
+        if resp.will_close:
+            conn.close()
+        else:
+            try:
+                self._idle.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+        return resp.status, data
+
+
+web1_pool = Web1ConnectionPool(WEB1_URL, WEB1_SEND_WORKERS)
+
+
+def upload_to_web1(send_id, fpath, filename, fields, idempotency_key=None):
+    """Upload video ke web 1 dengan retry + backoff; return JSON respon web 1."""
+    last_error = None
+    for attempt in range(1, WEB1_UPLOAD_RETRIES + 1):
+        def on_read(sent, total, attempt=attempt):
+            progress_store.update(send_id, progress=int(sent * 100 / total), bytes_sent=sent,
+                                  bytes_total=total, attempt=attempt,
+                                  message=f'Mengupload {sent * 100 // total}%')
+
+        progress_store.set(send_id, {'status': 'processing', 'type': 'send', 'progress': 0,
+                                     'filename': filename, 'attempt': attempt,
+                                     'message': 'Mulai upload...'})
+        body = MultipartFileBody(fields, 'video', fpath, filename, on_read=on_read)
+        headers = {
+            'Content-Type': body.content_type,
+            'Content-Length': str(body.length),
+        }
+        if WEB1_API_KEY:
+            headers['X-API-Key'] = WEB1_API_KEY
+        if idempotency_key:
+            headers['Idempotency-Key'] = idempotency_key
+        start = time.time()
+        try:
+            status, raw = web1_pool.request('POST', '/api/v1/submit', body=body, headers=headers)
+            if status < 500:
+                # 2xx / 4xx: jawaban final dari web 1, retry tidak akan mengubah hasil
+                seconds = time.time() - start
+                if status >= 400:
+                    record_failure('web1_upload', 'http_4xx', send_id=send_id, status=status)
+                else:
+                    metrics.observe('mvfi_stage_seconds', seconds, stage='web1_upload')
+                    metrics.inc('mvfi_bytes_total', body.length, stage='web1_upload', direction='out')
+                    log_event('stage', stage='web1_upload', send_id=send_id, seconds=round(seconds, 3),
+                              bytes=body.length, attempt=attempt)
+                break
+            last_error = Exception(f'HTTP {status} dari web 1')
+            record_failure('web1_upload', 'http_5xx', send_id=send_id, status=status, attempt=attempt)
+        except (http.client.HTTPException, OSError, ValueError) as e:
+            last_error = e
+            record_failure('web1_upload', 'network', send_id=send_id, error=str(e)[:200], attempt=attempt)
+        finally:
+            body.close()
+        if attempt < WEB1_UPLOAD_RETRIES:
+            wait = min(WEB1_BACKOFF_MAX, 2 ** attempt) + random.random()
+            progress_store.update(send_id, message=f'Upload gagal ({last_error}), coba lagi dalam {int(wait)} dtk...')
+            time.sleep(wait)
+    else:
+        raise last_error
+    # parse di luar retry: body non-JSON (mis. halaman HTML 413 dari proxy) tetap final
+    text = raw.decode('utf-8', errors='replace')
     try:
-        with open(SENT_LOG_FILE) as f:
-            return json.load(f)
-    except:
-        return []
+        return json.loads(text)
+    except ValueError:
+        if status < 400:  # 4xx sudah dicatat sebagai http_4xx
+            record_failure('web1_upload', 'bad_response', send_id=send_id, status=status)
+        excerpt = ' '.join(text.split())[:120]
+        raise Exception(f'HTTP {status} dari web 1, respon bukan JSON: {excerpt}')
+
+
+# ─── WEB 1 DELIVERY QUEUE ─────────────────────────────────
+# /send-to-web1 cuma memasukkan ke antrian (baris sent_log status 'queued');
+# pengiriman dikerjakan worker background di proses mana pun yang menjalankan
+# web1_sender. Baris 'sending' yang workernya mati diambil lagi (aman karena
+# web 1 menerima Idempotency-Key = delivery_id).
+WEB1_POLL_INTERVAL = 2
+WEB1_SEND_LEASE = (WEB1_UPLOAD_TIMEOUT + WEB1_BACKOFF_MAX) * (WEB1_UPLOAD_RETRIES + 1)
+
+
+class Web1Sender:
+    def __init__(self, workers):
+        self.workers = max(1, workers)
+        self.autostart = True
+        self._cond = threading.Condition()
+        self._lock = threading.Lock()
+        self._started = False
+        self._last_requeue = 0
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        self._requeue_stale()
+        for i in range(self.workers):
+            threading.Thread(target=self._worker, name=f'web1-send-{i}', daemon=True).start()
+
+    def _requeue_stale(self):
+        self._last_requeue = time.time()
+        requeue_stale_deliveries(WEB1_SEND_LEASE)
+
+    def enqueue(self, filename, fields):
+        """Catat pengiriman baru di sent_log (status queued) lalu bangunkan worker.
+
+        Return None kalau file ini sudah terkirim / masih di antrian."""
+        if self.autostart:
+            self.start()
+        # id selalu dari server: unik di sent_log dan jadi key progress_store
+        delivery_id = str(uuid.uuid4())
+        entry = get_video_entry(filename) or {}
+        added = add_sent_log_once({
+            'delivery_id': delivery_id,
+            'status':      'queued',
+            'filename':    filename,
+            'title':       fields.get('title', filename),
+            'thumb_url':   entry.get('thumb_url', ''),
+            'queued_at':   time.strftime('%Y-%m-%d %H:%M:%S'),
+            'web1_url':    WEB1_URL,
+            'timer_value': fields.get('timer_value'),
+            'timer_unit':  fields.get('timer_unit'),
+            'fields':      fields,
+        })
+        if not added:
+            return None
+        progress_store.set(delivery_id, {'status': 'queued', 'type': 'send', 'progress': 0,
+                                         'filename': filename, 'message': 'Menunggu antrian kirim...'})
+        with self._cond:
+            self._cond.notify()
+        return delivery_id
+
+    def _worker(self):
+        while True:
+            delivery_id = claim_delivery(worker_id())
+            if delivery_id is None:
+                if time.time() - self._last_requeue > WEB1_POLL_INTERVAL * 30:
+                    self._requeue_stale()
+                with self._cond:
+                    self._cond.wait(WEB1_POLL_INTERVAL)
+                continue
+            try:
+                self._deliver(delivery_id)
+            except Exception as e:
+                update_delivery(delivery_id, status='failed', error=str(e))
+                progress_store.set(delivery_id, {'status': 'error', 'type': 'send', 'message': str(e)})
+
+    def _deliver(self, delivery_id):
+        entry = get_delivery(delivery_id)
+        if not entry or entry.get('status') != 'sending':
+            return
+        filename = entry['filename']
+        fpath = os.path.join(HASIL_VIDEO_FOLDER, filename)
+        if not os.path.exists(fpath):
+            raise Exception(f'File tidak ditemukan: {filename}')
+        resp_data = upload_to_web1(delivery_id, fpath, filename, entry.get('fields', {}),
+                                   idempotency_key=delivery_id)
+        if not resp_data.get('success') and not resp_data.get('duplicate'):
+            raise Exception(resp_data.get('error', 'Web 1 menolak request'))
+        update_delivery(
+            delivery_id,
+            status='sent',
+            sent_at=time.strftime('%Y-%m-%d %H:%M:%S'),
+            queue_id=resp_data.get('queue_id', ''),
+            upload_at=resp_data.get('timer', {}).get('upload_at', ''),
+            github_url=resp_data.get('github', {}).get('url', ''),
+            duplicate=resp_data.get('duplicate', False),
+            error=None,
+        )
+        progress_store.set(delivery_id, {
+            'status': 'done', 'type': 'send', 'progress': 100,
+            'message': resp_data.get('message', 'Berhasil dikirim'),
+            'filename': filename,
+            'queue_id': resp_data.get('queue_id', ''),
+            'upload_at': resp_data.get('timer', {}).get('upload_at', ''),
+            'duplicate': resp_data.get('duplicate', False),
+        })
 
-def save_sent_log(data):
-    with open(SENT_LOG_FILE, 'w') as f:
-        json.dump(data, f, indent=2)
 
-def is_already_sent(filename):
-    log = load_sent_log()
-    return any(e.get('filename') == filename for e in log)
+web1_sender = Web1Sender(WEB1_SEND_WORKERS)
+
 
 @app.route('/sent-log')
 def get_sent_log():
     """Return daftar video yang sudah dikirim ke web 1."""
-    return jsonify(load_sent_log())
+    filters = _date_filters('sent_at')
+    if request.args.get('status'):
+        filters.append(('t.status = ?', [request.args['status']]))
+    return log_listing('sent_log', filters)
 
-@app.route('/send-to-web1', methods=['POST'])
-def send_to_web1():
-    data = request.json or {}
-    filename    = data.get('filename', '')
+def web1_fields(data, filename):
+    """Field form untuk web 1 dari body request (title default: judul di log video)."""
     timer_value = data.get('timer_value', 5)
     timer_unit  = data.get('timer_unit', 'hours')
     title       = data.get('title', '')
     tags        = data.get('tags', [])
     description = data.get('description', '')
-
-    if not filename:
-        return jsonify({'error': 'filename wajib diisi'}), 400
-
-    if is_already_sent(filename):
-        return jsonify({'error': 'Video ini sudah pernah dikirim ke web 1'}), 409
-
-    fpath = os.path.join(HASIL_VIDEO_FOLDER, filename)
-    if not os.path.exists(fpath):
-        return jsonify({'error': f'File tidak ditemukan: {filename}'}), 404
-
-    log_path = os.path.join(HASIL_VIDEO_FOLDER, 'log.json')
-    log = []
-    if os.path.exists(log_path):
-        try:
-            with open(log_path) as f:
-                log = json.load(f)
-        except:
-            log = []
-    entry = next((e for e in log if e.get('filename') == filename), {})
     if not title:
-        title = entry.get('title', filename)
-
-    # Kirim ke Web 1
-    import urllib.request as ur
-
-    try:
-        boundary = '----FormBoundary' + uuid.uuid4().hex
-        body_parts = []
-
-        def add_field(name, value):
-            body_parts.append(
-                f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
-            )
-
-        add_field('timer_value', str(timer_value))
-        add_field('timer_unit', timer_unit)
-        if title:
-            add_field('title', title)
-        if description:
-            add_field('description', description)
-        if tags:
-            add_field('tags', ','.join(tags) if isinstance(tags, list) else str(tags))
-
-        with open(fpath, 'rb') as vf:
-            file_data = vf.read()
+        title = (get_video_entry(filename) or {}).get('title', filename)
+    fields = {'timer_value': str(timer_value), 'timer_unit': timer_unit}
+    if title:
+        fields['title'] = title
+    if description:
+        fields['description'] = description
+    if tags:
+        fields['tags'] = ','.join(tags) if isinstance(tags, list) else str(tags)
+    return fields
+
+
+def enqueue_send(data):
+    """Validasi lalu antrikan satu video. Return (delivery_id, None) atau (None, (pesan, status))."""
+    filename = data.get('filename', '')
+    if not filename:
+        return None, ('filename wajib diisi', 400)
+    if not os.path.exists(os.path.join(HASIL_VIDEO_FOLDER, filename)):
+        return None, (f'File tidak ditemukan: {filename}', 404)
+    # cek "sudah dikirim" + insert satu transaksi di enqueue (aman antar proses)
+    delivery_id = web1_sender.enqueue(filename, web1_fields(data, filename))
+    if delivery_id is None:
+        return None, ('Video ini sudah pernah dikirim ke web 1', 409)
+    return delivery_id, None
 
-        body_parts.append(
-            f'--{boundary}\r\nContent-Disposition: form-data; name="video"; filename="{filename}"\r\nContent-Type: video/mp4\r\n\r\n'.encode()
-        )
-        body_parts.append(file_data)
-        body_parts.append(f'\r\n--{boundary}--\r\n'.encode())
 
-        body = b''.join(body_parts)
-        headers = {
-            'Content-Type': f'multipart/form-data; boundary={boundary}',
-            'Content-Length': str(len(body)),
-        }
-        if WEB1_API_KEY:
-            headers['X-API-Key'] = WEB1_API_KEY
+@app.route('/send-to-web1', methods=['POST'])
+def send_to_web1():
+    data = request.json or {}
+    delivery_id, err = enqueue_send(data)
+    if err:
+        return jsonify({'error': err[0]}), err[1]
 
-        req = ur.Request(
-            f'{WEB1_URL.rstrip("/")}/api/v1/submit',
-            data=body, headers=headers, method='POST'
-        )
+    return jsonify({
+        'ok': True,
+        'queued': True,
+        'delivery_id': delivery_id,
+        'send_id': delivery_id,
+        'message': 'Masuk antrian kirim',
+    }), 202
 
-        with ur.urlopen(req, timeout=300) as resp:
-            resp_data = json.loads(resp.read().decode('utf-8'))
 
-    except Exception as e:
-        return jsonify({'error': f'Gagal menghubungi web 1: {str(e)}'}), 500
-
-    if not resp_data.get('success') and not resp_data.get('duplicate'):
-        return jsonify({'error': resp_data.get('error', 'Web 1 menolak request')}), 500
-
-    sent_entry = {
-        'filename':    filename,
-        'title':       title,
-        'thumb_url':   entry.get('thumb_url', ''),
-        'sent_at':     time.strftime('%Y-%m-%d %H:%M:%S'),
-        'web1_url':    WEB1_URL,
-        'queue_id':    resp_data.get('queue_id', ''),
-        'timer_value': timer_value,
-        'timer_unit':  timer_unit,
-        'upload_at':   resp_data.get('timer', {}).get('upload_at', ''),
-        'github_url':  resp_data.get('github', {}).get('url', ''),
-        'duplicate':   resp_data.get('duplicate', False),
-    }
-    sent_log = load_sent_log()
-    sent_log.insert(0, sent_entry)
-    save_sent_log(sent_log)
+@app.route('/send-to-web1/batch', methods=['POST'])
+def send_to_web1_batch():
+    """Kirim banyak video sekaligus.
 
-    return jsonify({
-        'ok': True,
-        'message': resp_data.get('message', 'Berhasil dikirim'),
-        'queue_id': resp_data.get('queue_id', ''),
-        'timer': resp_data.get('timer', {}),
-        'upload_at': resp_data.get('timer', {}).get('upload_at', ''),
-        'duplicate': resp_data.get('duplicate', False),
-    })
+    Body: {"items": [{"filename": ..., "title": ...}, ...]} atau
+    {"filenames": [...], ...field bersama (timer_value, tags, ...)}.
+    """
+    data = request.json or {}
+    items = data.get('items')
+    if items is None:
+        shared = {k: v for k, v in data.items() if k != 'filenames'}
+        items = [dict(shared, filename=f) for f in data.get('filenames', [])]
+    if not items:
+        return jsonify({'error': 'items / filenames wajib diisi'}), 400
+
+    results = []
+    for item in items:
+        delivery_id, err = enqueue_send(item)
+        if err:
+            results.append({'filename': item.get('filename', ''), 'ok': False, 'error': err[0]})
+            continue
+        results.append({'filename': item['filename'], 'ok': True, 'delivery_id': delivery_id})
+    queued = sum(1 for r in results if r['ok'])
+    return jsonify({'ok': queued > 0, 'queued': queued, 'results': results}), 202
 
 
 # ─── INFO JSON ────────────────────────────────────────────────
@@ -776,42 +4133,23 @@ def get_info(filename):
 
 # ─── MAKER VIDEO LOG ──────────────────────────────────────────
 
-MAKER_LOG_FILE = os.path.join(BASE_DIR, 'maker_log.json')
-
-def load_maker_log():
-    if not os.path.exists(MAKER_LOG_FILE):
-        return []
-    try:
-        with open(MAKER_LOG_FILE) as f:
-            return json.load(f)
-    except:
-        return []
-
-def save_maker_log(data):
-    with open(MAKER_LOG_FILE, 'w') as f:
-        json.dump(data, f, indent=2)
-
 @app.route('/maker-log')
 def get_maker_log():
-    return jsonify(load_maker_log())
+    filters = _date_filters('created_at') + _sent_filter()
+    if request.args.get('music'):
+        filters.append(("json_extract(t.data, '$.music') = ?", [request.args['music']]))
+    return log_listing('maker_log', filters, with_sent=True)
 
 @app.route("/maker-log/delete/<filename>", methods=["DELETE"])
 def delete_maker_log(filename):
-    # Hapus dari maker_log
-    log = load_maker_log()
-    log = [e for e in log if e.get("filename") != filename]
-    save_maker_log(log)
-    # Hapus dari hasil_video/log.json juga
-    hasil_log_path = os.path.join(HASIL_VIDEO_FOLDER, "log.json")
-    if os.path.exists(hasil_log_path):
-        try:
-            with open(hasil_log_path) as f:
-                hasil_log = json.load(f)
-            hasil_log = [e for e in hasil_log if e.get("filename") != filename]
-            with open(hasil_log_path, "w") as f:
-                json.dump(hasil_log, f, indent=2)
-        except:
-            pass
+    # Hapus dari maker_log dan log hasil_video
+    entry = get_video_entry(filename)
+    delete_maker_log_entry(filename)
+    delete_video_log(filename)
+    delete_render_cache(filename)
+    if entry and entry.get('id') and not get_video_by_id(entry['id']):
+        delete_thumbnails(entry['id'])  # poster dipakai bersama semua rendition job ini
+        duplicate_index.remove(entry['id'])
     # Hapus file video dari hasil_video/
     path = os.path.join(HASIL_VIDEO_FOLDER, filename)
     if os.path.exists(path):
@@ -819,10 +4157,52 @@ def delete_maker_log(filename):
     return jsonify({"ok": True})
 
 
+def start_services(background=True):
+    """Siapkan folder + database; background=True juga menjalankan worker render & kirim.
+
+    Proses web yang background=False tetap bisa submit job / delivery; yang
+    mengerjakan adalah proses lain (`python main.py worker`) lewat database.
+    """
+    for folder in (UPLOAD_FOLDER, OUTPUT_FOLDER, HASIL_VIDEO_FOLDER):
+        os.makedirs(folder, exist_ok=True)
+    get_db()
+    metrics.start()
+    music_index.start()
+    duplicate_index.start()
+    render_queue.autostart = web1_sender.autostart = background
+    if background:
+        render_queue.start()
+        web1_sender.start()
+
+
+def worker_cli():
+    """`python main.py worker`: proses render + kirim web 1 tanpa server HTTP."""
+    start_services(background=True)
+    print(f"🛠️  Worker {worker_id()} jalan: {RENDER_WORKERS} render, {WEB1_SEND_WORKERS} kirim web 1")
+    print(f"🗄️  Database: {DB_FILE}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+
 if __name__ == '__main__':
+    if sys.argv[1:2] == ['batch']:
+        batch_cli(sys.argv[2:])
+        sys.exit(0)
+    if sys.argv[1:2] == ['worker']:
+        worker_cli()
+        sys.exit(0)
     os.makedirs(UPLOAD_FOLDER, exist_ok=True)
     os.makedirs(OUTPUT_FOLDER, exist_ok=True)
     os.makedirs(HASIL_VIDEO_FOLDER, exist_ok=True)
+    get_db()
     print("\n🎬 Video Creator siap di http://localhost:5000")
     print(f"📁 Folder musik: {get_music_folder()}")
+    print(f"⚙️  Render worker: {RENDER_WORKERS}")
+    print("   (production: gunicorn -c gunicorn.conf.py wsgi:app)")
+    # Dengan reloader, modul ini jalan dua kali; worker cukup di proses anak
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_services()
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,16 @@
+"""Entry point WSGI untuk production (multi proses).
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Semua state bersama (progress, antrian render, antrian kirim web 1, log)
+ada di database SQLite (MVFI_DB), jadi beberapa worker HTTP dan proses
+`python main.py worker` bisa jalan barengan di mesin yang sama.
+
+MVFI_BACKGROUND_IN_WEB=0 -> proses web hanya melayani HTTP; render dan kirim
+web 1 dikerjakan oleh `python main.py worker` yang dijalankan terpisah.
+"""
+import os
+
+from main import app, start_services
+
+start_services(background=os.environ.get('MVFI_BACKGROUND_IN_WEB', '1') == '1')